@@ -0,0 +1,114 @@
+import hashlib
+import sqlite3
+import threading
+import zlib
+from argparse import ArgumentParser
+
+
+ARCHIVE = "setpoints\\archive.db"
+
+
+class DumpArchive:
+    """Content-addressed archive of raw SHO listings
+
+    Each distinct listing is stored once, compressed and keyed by its SHA-256. An index keyed
+    by FID, sweep timestamp and group points at the listing every sweep retrieved, so an
+    unchanged listing costs one index row per sweep and any past listing is a keyed lookup.
+    """
+    def __init__(self, file_name=ARCHIVE):
+        # Listings are added from the sweep's parse workers, which the lock serialises
+        self.connection = sqlite3.connect(file_name, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS listings (
+            hash TEXT PRIMARY KEY, size INTEGER NOT NULL, data BLOB NOT NULL) WITHOUT ROWID""")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS dumps (
+            fid TEXT NOT NULL, timestamp TEXT NOT NULL, setting_group INTEGER NOT NULL, active INTEGER NOT NULL,
+            hash TEXT NOT NULL REFERENCES listings (hash),
+            PRIMARY KEY (fid, timestamp, setting_group)) WITHOUT ROWID""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS dumps_timestamp ON dumps (timestamp)")
+        self.connection.commit()
+
+
+    def add(self, fid, timestamp, listings, active):
+        """Stores a recloser's listings from one sweep, given as {group: listing}, and returns their hashes"""
+        hashes = {}
+        with self.lock:
+            for group, listing in listings.items():
+                data = listing.encode('utf-8')
+                digest = hashlib.sha256(data).hexdigest()
+                self.connection.execute("INSERT OR IGNORE INTO listings VALUES (?, ?, ?)", (digest, len(data), zlib.compress(data, 9)))
+                self.connection.execute("INSERT OR REPLACE INTO dumps VALUES (?, ?, ?, ?, ?)", (fid, timestamp, group, int(group == active), digest))
+                hashes[group] = digest
+            self.connection.commit()
+        return hashes
+
+
+    def listing(self, digest):
+        """Returns the listing with a hash, or None"""
+        row = self.connection.execute("SELECT data FROM listings WHERE hash = ?", (digest,)).fetchone()
+        return zlib.decompress(row[0]).decode('utf-8') if row else None
+
+
+    def get(self, fid, timestamp, group=None):
+        """Returns a device's listing from a sweep, of the active group unless another is given, or None"""
+        if group is None:
+            row = self.connection.execute("SELECT hash FROM dumps WHERE fid = ? AND timestamp = ? AND active = 1", (fid, timestamp)).fetchone()
+        else:
+            row = self.connection.execute("SELECT hash FROM dumps WHERE fid = ? AND timestamp = ? AND setting_group = ?", (fid, timestamp, group)).fetchone()
+        return self.listing(row[0]) if row else None
+
+
+    def history(self, fid):
+        """Returns (timestamp, group, active, hash) for every listing archived for a device, oldest first"""
+        return self.connection.execute("SELECT timestamp, setting_group, active, hash FROM dumps WHERE fid = ? ORDER BY timestamp, setting_group",
+                                       (fid,)).fetchall()
+
+
+    def sweep(self, timestamp):
+        """Yields (fid, group, listing) for every listing of a sweep, each device's active group first"""
+        cursor = self.connection.execute("SELECT fid, setting_group, hash FROM dumps WHERE timestamp = ? ORDER BY fid, active DESC, setting_group",
+                                         (timestamp,))
+        for fid, group, digest in cursor:
+            yield fid, group, self.listing(digest)
+
+
+    def stats(self):
+        """Returns the number of dumps, of distinct listings, and the raw and compressed bytes of the listings"""
+        dumps = self.connection.execute("SELECT COUNT(*) FROM dumps").fetchone()[0]
+        listings, size, stored = self.connection.execute("SELECT COUNT(*), TOTAL(size), TOTAL(LENGTH(data)) FROM listings").fetchone()
+        return dumps, listings, int(size), int(stored)
+
+
+    def close(self):
+        """Closes the archive"""
+        self.connection.close()
+
+
+def main():
+    parser = ArgumentParser(description="Queries the archive of raw setpoint listings")
+    parser.add_argument("--archive", default=ARCHIVE, help="archive file (default " + ARCHIVE + ")")
+    commands = parser.add_subparsers(dest="command", required=True)
+    get = commands.add_parser("get", help="print a device's listing from a sweep")
+    get.add_argument("fid")
+    get.add_argument("timestamp", help="sweep timestamp, for example \"20240101 06:00\"")
+    get.add_argument("--group", type=int, help="settings group (default the active group)")
+    history = commands.add_parser("history", help="print the sweeps a device's listings were archived by")
+    history.add_argument("fid")
+    commands.add_parser("stats", help="print how much the archive stores")
+    args = parser.parse_args()
+
+    archive = DumpArchive(args.archive)
+    if args.command == "get":
+        listing = archive.get(args.fid, args.timestamp, args.group)
+        print(listing if listing is not None else "No listing archived for " + args.fid + " at " + args.timestamp)
+    elif args.command == "history":
+        for timestamp, group, active, digest in archive.history(args.fid):
+            print(timestamp + " group " + str(group) + (" (active) " if active else " ") + digest[:12])
+    elif args.command == "stats":
+        dumps, listings, size, stored = archive.stats()
+        print(str(dumps) + " dumps, " + str(listings) + " distinct listings, " + str(size) + " bytes stored in " + str(stored))
+    archive.close()
+
+
+if __name__ == "__main__":
+    main()
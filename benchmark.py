@@ -0,0 +1,137 @@
+import asyncio
+import io
+import json
+import os
+import tempfile
+from argparse import ArgumentParser
+from contextlib import nullcontext, redirect_stdout
+from datetime import datetime
+from time import perf_counter
+
+from main import Recloser, ResultWriter, output_file_name, percentile, phase_summary, prescan, sweep_async
+from simulator import RelaySimulator, SimulatedRelay
+
+
+def build_relays(args):
+    """Builds the simulated fleet described by the command line"""
+    models = args.models.split(",")
+    relays = []
+    for i in range(args.devices):
+        behaviour = "normal"
+        if i < args.refused:
+            behaviour = "refuse"
+        elif i < args.refused + args.timeouts:
+            behaviour = "timeout"
+        lockouts = 1 if args.refused + args.timeouts <= i < args.refused + args.timeouts + args.lockouts else 0
+        relays.append(SimulatedRelay(model=models[i % len(models)], latency=args.latency, page_lines=args.page_lines,
+                                     behaviour=behaviour, lockouts=lockouts, password="OTTER"))
+    return relays
+
+
+def build_reclosers(addresses, args, config_cache, results):
+    """Builds a Recloser for each simulated relay"""
+    reclosers = []
+    for i, (host, port) in enumerate(addresses):
+        # Every simulated relay is on localhost, so relays are spread over the requested number of gateways
+        gateway = "GW" + str(i % args.gateways + 1) if args.gateways else "GW" + str(i + 1)
+        recloser = Recloser(fid="SIM" + str(i + 1).zfill(5), ip=host, port=port, results=results, gateway=gateway)
+        recloser.TIMEOUT = args.connect_timeout
+        recloser.config_cache = config_cache
+        recloser.all_groups = args.all_groups
+        recloser.full_listing = args.full_listings
+        reclosers.append(recloser)
+    return reclosers
+
+
+def run_benchmark(args):
+    """Sweeps a simulated fleet and returns the benchmark report"""
+    relays = build_relays(args)
+    simulator = RelaySimulator(relays)
+    addresses = simulator.start()
+    timestamp = datetime.now().strftime("%Y%m%d %H:%M")
+    cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # The sweep writes PASSWORD, logs and setpoints relative to the working directory
+        os.chdir(directory)
+        os.makedirs("logs")
+        os.makedirs("setpoints")
+        with open("PASSWORD", "w") as file:
+            file.write("OTTER")
+        results = ResultWriter(output_file_name(timestamp))
+        try:
+            with nullcontext() if args.verbose else redirect_stdout(io.StringIO()):
+                # An incremental benchmark measures a second sweep over an unchanged fleet
+                config_cache = {} if args.incremental else None
+                if args.incremental:
+                    asyncio.run(sweep_async(build_reclosers(addresses, args, config_cache, results), timestamp, args.concurrency,
+                                            gateway_limit=args.gateway_concurrency, retries=args.retries, backoff=args.backoff))
+
+                reclosers = build_reclosers(addresses, args, config_cache, results)
+                start = perf_counter()
+                swept = reclosers
+                if args.prescan:
+                    swept = asyncio.run(prescan(reclosers, args.prescan_timeout, args.devices, results))
+                asyncio.run(sweep_async(swept, timestamp, args.concurrency,
+                                        gateway_limit=args.gateway_concurrency, retries=args.retries, backoff=args.backoff))
+                elapsed = perf_counter() - start
+        finally:
+            results.close()
+            os.chdir(cwd)
+            simulator.stop()
+
+    latencies = [sum(phase["seconds"] for phase in recloser.metrics.values()) for recloser in reclosers if recloser.metrics]
+    return {
+        "devices": len(reclosers),
+        "concurrency": args.concurrency,
+        "latency": args.latency,
+        "elapsed": elapsed,
+        "devices_per_second": len(reclosers) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "phases": phase_summary(reclosers),
+    }
+
+
+def print_report(report):
+    """Prints the benchmark report as a table"""
+    print("Devices: " + str(report["devices"]) + "  Concurrency: " + str(report["concurrency"]) + "  Latency: " + str(report["latency"]) + " s")
+    print("Elapsed: %.2f s  Devices/s: %.2f  p50: %.3f s  p95: %.3f s" % (report["elapsed"], report["devices_per_second"], report["p50"], report["p95"]))
+    print("%-20s %8s %10s %10s %10s %10s" % ("Phase", "Devices", "Total s", "Mean s", "p95 s", "Bytes"))
+    for phase, times in report["phases"].items():
+        print("%-20s %8d %10.3f %10.3f %10.3f %10d" % (phase, times["devices"], times["total"], times["mean"], times["p95"], times["bytes"]))
+
+
+def main():
+    parser = ArgumentParser(description="Sweeps a simulated relay fleet and reports throughput and per-phase latency")
+    parser.add_argument("--devices", type=int, default=50, help="number of simulated relays")
+    parser.add_argument("--concurrency", type=int, default=10, help="maximum number of relays swept at once")
+    parser.add_argument("--models", default="651R,351R,351RS", help="comma separated models assigned to relays in turn")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds before each relay response")
+    parser.add_argument("--page-lines", type=int, default=20, help="lines per page of a 351R/351RS listing")
+    parser.add_argument("--refused", type=int, default=0, help="number of relays that refuse connections")
+    parser.add_argument("--timeouts", type=int, default=0, help="number of relays whose connections time out")
+    parser.add_argument("--lockouts", type=int, default=0, help="number of relays that reset their first session")
+    parser.add_argument("--gateways", type=int, default=0, help="number of gateways the relays are spread over (default one per relay)")
+    parser.add_argument("--gateway-concurrency", type=int, default=0, help="maximum sessions at once through one gateway (default no limit)")
+    parser.add_argument("--retries", type=int, default=1, help="times a failed relay is retried at the end of the sweep")
+    parser.add_argument("--backoff", type=float, default=5, help="seconds a gateway waits after its first failure")
+    parser.add_argument("--connect-timeout", type=float, default=5, help="connect timeout used by each Recloser")
+    parser.add_argument("--full-listings", action="store_true", help="page through whole listings rather than stopping once the needed settings are read")
+    parser.add_argument("--all-groups", action="store_true", help="retrieve every settings group of each relay")
+    parser.add_argument("--incremental", action="store_true", help="measure a repeat sweep that reuses unchanged setpoints")
+    parser.add_argument("--prescan", action="store_true", help="probe the fleet in parallel before sweeping it")
+    parser.add_argument("--prescan-timeout", type=float, default=1.5, help="seconds to wait for each probe")
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the sweep's own output")
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import glob
+import os
+from operator import attrgetter
+from argparse import ArgumentParser
+from csv import writer
+
+from archive import DumpArchive
+from main import GROUP_FILE, parse_listing, reparse_dump, setpoint_file_name
+from store import SETTING_COLUMNS, SetpointRecord, read_records
+
+
+# Settings compared field by field, the group column is reported as a group change instead
+FIELDS = tuple(column for column in SETTING_COLUMNS if column != "setting_group")
+settings = attrgetter(*FIELDS)
+
+
+def listing_records(directory):
+    """Yields a record for every saved setpoint listing in a directory, each device's active group first"""
+    prefix, suffix = setpoint_file_name("*").rsplit("\\", 1)[-1].split("*")
+    listings = {}
+    for file_name in sorted(glob.glob(os.path.join(directory, prefix + "*" + suffix))):
+        name = os.path.basename(file_name)[len(prefix):-len(suffix)]
+        fid = GROUP_FILE.sub("", name)
+        listings.setdefault(fid, []).append((name != fid, file_name))
+    for fid, files in listings.items():
+        for inactive, file_name in sorted(files):
+            row, errors = reparse_dump((file_name, fid, ""))
+            if row is not None:
+                yield SetpointRecord.from_row(row)
+
+
+def archive_records(file_name, timestamp):
+    """Yields a record for every listing a sweep stored in a dump archive, each device's active group first"""
+    archive = DumpArchive(file_name)
+    try:
+        for fid, group, listing in archive.sweep(timestamp):
+            row, errors = parse_listing(listing, fid, "", timestamp)
+            if row is not None:
+                yield SetpointRecord.from_row(row)
+    finally:
+        archive.close()
+
+
+def sweep_records(source):
+    """Yields the records of a sweep output file, a directory of saved listings or an archived sweep given as archive@timestamp"""
+    if "@" in source:
+        return archive_records(*source.split("@", 1))
+    if os.path.isdir(source):
+        return listing_records(source)
+    return read_records(source)
+
+
+def same(old, new, tolerance):
+    """Returns True if two settings are equal, numbers within the tolerance"""
+    if isinstance(old, float) and isinstance(new, float):
+        return abs(old - new) <= tolerance
+    return old == new
+
+
+def compare_records(old, new, tolerance):
+    """Returns (column, old value, new value) for every setting that differs between two records"""
+    if settings(old) == settings(new):
+        return []
+    return [(column, getattr(old, column), getattr(new, column)) for column in FIELDS
+            if not same(getattr(old, column), getattr(new, column), tolerance)]
+
+
+def compare_device(fid, old_groups, new_groups, tolerance):
+    """Returns the changes to one device, whose groups map group numbers to records with the active group first"""
+    changes = []
+    old_active = next(iter(old_groups))
+    new_active = next(iter(new_groups))
+    if old_active != new_active:
+        changes.append((fid, "group", "setting_group", old_active, new_active))
+
+    # Compares group by group, or the active groups when no group was retrieved by both sweeps
+    pairs = [(group, group) for group in old_groups if group in new_groups] or [(old_active, new_active)]
+    for old_group, new_group in pairs:
+        for column, old_value, new_value in compare_records(old_groups[old_group], new_groups[new_group], tolerance):
+            changes.append((fid, "changed", "G" + str(new_group) + " " + column, old_value, new_value))
+    return changes
+
+
+def index_sweep(records):
+    """Indexes records by FID and group, the first group of each FID being the active one"""
+    index = {}
+    for record in records:
+        index.setdefault(record.fid, {}).setdefault(record.setting_group, record)
+    return index
+
+
+def diff_sweeps(old_index, new_records, tolerance):
+    """Compares a sweep, one FID at a time as it is read, to the index of the sweep before it
+
+    Returns the changes and the index of the new sweep. A sweep writes the rows of a FID
+    together, so a FID is compared as soon as the next one starts. Rows of a FID seen again
+    later in the file are ignored.
+    """
+    changes = []
+    new_index = {}
+
+    def finish(fid):
+        if fid in old_index:
+            changes.extend(compare_device(fid, old_index[fid], new_index[fid], tolerance))
+        else:
+            changes.append((fid, "added", "", "", ""))
+
+    current = None
+    for record in new_records:
+        if record.fid != current:
+            if current is not None:
+                finish(current)
+            current = None if record.fid in new_index else record.fid
+        if current is not None:
+            new_index.setdefault(record.fid, {}).setdefault(record.setting_group, record)
+    if current is not None:
+        finish(current)
+
+    changes.extend((fid, "removed", "", "", "") for fid in old_index if fid not in new_index)
+    return changes, new_index
+
+
+def main():
+    parser = ArgumentParser(description="Reports the devices added, removed or with changed settings between consecutive sweeps")
+    parser.add_argument("sweeps", nargs="+", help="output files, directories of saved setpoint listings or archived sweeps as archive@timestamp, oldest first")
+    parser.add_argument("--tolerance", type=float, default=0.001, help="largest difference between numeric settings treated as equal (default 0.001)")
+    parser.add_argument("--csv", help="also write the changes to this file")
+    args = parser.parse_args()
+    if len(args.sweeps) < 2:
+        parser.error("at least two sweeps are needed")
+
+    rows = []
+    index = index_sweep(sweep_records(args.sweeps[0]))
+    for old, new in zip(args.sweeps, args.sweeps[1:]):
+        changes, index = diff_sweeps(index, sweep_records(new), args.tolerance)
+        print(old + " -> " + new + ": " + str(len(changes)) + " changes")
+        for fid, change, column, old_value, new_value in changes:
+            if change == "added" or change == "removed":
+                print("  " + fid + " " + change)
+            else:
+                print("  " + fid + " " + column + ": " + str(old_value) + " -> " + str(new_value))
+            rows.append([old, new, fid, change, column, old_value, new_value])
+
+    if args.csv:
+        with open(args.csv, "w", newline='') as file:
+            output = writer(file)
+            output.writerow(["old", "new", "fid", "change", "setting", "old value", "new value"])
+            output.writerows(rows)
+
+
+if __name__ == "__main__":
+    main()
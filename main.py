@@ -1,15 +1,118 @@
-from telnetlib import Telnet
-from time import sleep
+from transport import Telnet
+from archive import ARCHIVE, DumpArchive
+from store import DATABASE, SetpointStore
+from time import monotonic, perf_counter, sleep, time
+from functools import lru_cache, wraps
 import socket
+import re
+import os
+import json
+import asyncio
+import threading
+import glob
+import hashlib
+import heapq
+import random
+import io
+from contextlib import redirect_stdout
+from argparse import ArgumentParser, ArgumentTypeError
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from csv import reader, writer
 from datetime import datetime
 
 
+ERROR_LOG = "logs\\connection_errors.txt"
+
+# SEL prompts are "=" at access level 0, "=>" at level 1 and "==>" at level 2
+PROMPT = re.compile(rb"[\r\n]=+>?[ \t]*$")
+ACCESS_PROMPT = re.compile(rb"[\r\n]==?>[ \t]*$")
+PASSWORD_PROMPT = re.compile(rb"Password:")
+
+# The ID and GRO responses end at the prompt following their last line
+ID_END = re.compile(rb'"[ \t]*[\r\n]+=+>?[ \t]*$')
+GROUP_END = re.compile(rb"Active Group = \d+\s*[\r\n]=+>?[ \t]*$")
+
+CONFIG_CACHE = "setpoints\\config_ids.json"
+INVENTORY = "setpoints\\inventory.json"
+
+# Last success, last failure and consecutive failures of every recloser swept, by FID
+ATTEMPTS = "setpoints\\attempts.json"
+
+# Metrics files of earlier sweeps, read for the expected duration of each model
+METRICS_FILES = "logs\\metrics_*.json"
+
+# Journal of the reclosers completed by the current sweep, one JSON object per line
+CHECKPOINT = "logs\\checkpoint.txt"
+
+# Errors after which a recloser is retried at the end of the sweep and its gateway backs off
+RETRYABLE_ERRORS = ("Timed out", "Refused connection", "Unreachable", "Lockout", "Connection lost")
+
+# Timed phases of a recloser's sweep, in order
+PHASES = ("connect_recloser", "retrieve_model", "login", "retrieve_group", "retrieve_setpoints", "parse_all_settings")
+
+# Models that pause the SHO listing between pages until they receive a CRLF
+PAGED_MODELS = ("351R", "351RS")
+
+# CTRL-X, which cancels the rest of a listing
+CANCEL = b"\x18"
+
+# Bytes kept from the end of the last read of a listing, enough for a line break and prompt
+PROMPT_TAIL = 64
+
+# Settings groups of each model, retrieved in full with --all-groups
+GROUP_COUNTS = {"651R": 8, "351R": 6, "351RS": 6}
+
+# Suffix of the name of a file holding the listing of an inactive group
+GROUP_FILE = re.compile(r" G\d+$")
+
+# One "NAME := value" (651R) or "NAME = value" (351R/351RS) setting, the value runs up to the next setting on the line
+SETTING = re.compile(r"([A-Za-z0-9_]+)[ \t]*:?=(?!>)[ \t]*(.*?)[ \t]*(?=[ \t][A-Za-z0-9_]+[ \t]*:?=|[\r\n]|$)")
+
+PHASE_FIELDS = ("phPU", "phFC", "phFTD", "phSC", "phSTD")
+GROUND_FIELDS = ("gPU", "gFC", "gFTD", "gSC", "gSTD")
+
+# Setting names for each field by model, the 351RS has no separate ground elements so it repeats the phase settings
+SETTING_NAMES = {
+    "651R": {"ctr": "CTR", "phPU": "51PJP", "phFC": "51PJC", "phFTD": "51PJTD", "phSC": "51PKC", "phSTD": "51PKTD",
+             "gPU": "51G1JP", "gFC": "51G1JC", "gFTD": "51G1JTD", "gSC": "51G1KC", "gSTD": "51G1KTD"},
+    "351R": {"ctr": "CTR", "phPU": "51P1P", "phFC": "51P1C", "phFTD": "51P1TD", "phSC": "51P2C", "phSTD": "51P2TD",
+             "gPU": "51G1P", "gFC": "51G1C", "gFTD": "51G1TD", "gSC": "51G2C", "gSTD": "51G2TD"},
+    "351RS": {"ctr": "CTR", "phPU": "51P1P", "phFC": "51P1C", "phFTD": "51P1TD", "phSC": "51P2C", "phSTD": "51P2TD",
+              "gPU": "51P1P", "gFC": "51P1C", "gFTD": "51P1TD", "gSC": "51P2C", "gSTD": "51P2TD"},
+}
+
+SETTING_DESCRIPTIONS = {
+    "phPU": "phase pickup", "phFC": "phase fast curve", "phFTD": "phase fast time dial",
+    "phSC": "phase slow curve", "phSTD": "slow curve time dial",
+    "gPU": "ground pickup", "gFC": "ground fast curve", "gFTD": "ground fast time dial",
+    "gSC": "ground slow curve", "gSTD": "ground slow time dial",
+}
+
+
+def timed(method):
+    """Records the wall-clock time and bytes received of a Recloser phase in the recloser's metrics"""
+    @wraps(method)
+    def timed_method(self, *args, **kwargs):
+        received = self.bytes_received()
+        start = perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            phase = self.metrics.setdefault(method.__name__, {"seconds": 0.0, "bytes": 0})
+            phase["seconds"] += perf_counter() - start
+            # A retried connection starts a new session whose count restarts from zero
+            phase["bytes"] += max(self.bytes_received() - received, 0)
+    return timed_method
+
+
 class Recloser:
     """Contains protective device information for a recloser"""
-    def __init__(self, fid, ip, group=9, phPU=1, phFC=1, phFTD=1, phSC=1, phSTD=1, gPU=1, gFC=1, gFTD=1, gSC=1, gSTD=1, model=1, ctr=1000):
+    def __init__(self, fid, ip, group=9, phPU=1, phFC=1, phFTD=1, phSC=1, phSTD=1, gPU=1, gFC=1, gFTD=1, gSC=1, gSTD=1, model=1, ctr=1000, port=1700, results=None, gateway=None):
         self.fid = fid
         self.ip = ip
+        self.port = port
+        self.results = results
+        self.gateway = gateway if gateway else subnet(ip)
         self.group = group
         self.phPU = phPU
         self.phFC = phFC
@@ -22,31 +125,47 @@ class Recloser:
         self.gSC = gSC
         self.gSTD = gSTD
         self.model = model
+        self.ctr = ctr
         self.TIMEOUT = 5
-        self.WAIT = 1
+        self.COMMAND_TIMEOUT = 5
+        self.SETPOINT_TIMEOUT = 30
+        self.PAGE_WAIT = 1
         self.setpoints = ""
-        with open("PASSWORD", "r") as file:
-            self.password = file.read()
+        self.group_files = {}
+        self.group_settings = {}
+        self.all_groups = False
+        self.full_listing = False
+        self.settings = {}
+        self.config_id = ""
+        self.config_cache = None
+        self.inventory = None
+        self.archive = None
+        self.firmware = ""
+        self.identified = 0
+        self.metrics = {}
+        self.errors = []
         
+    @timed
     def connect_recloser(self):
         """Connects to a recloser"""
         try:
-            self.tn = Telnet(host=self.ip, port=1700, timeout=self.TIMEOUT)
+            self.tn = Telnet(host=self.ip, port=self.port, timeout=self.TIMEOUT)
         except socket.timeout:
             print(self.ip + " Timed Out\n")
-            with open("logs\\connection_errors.txt", "a") as file:
-                file.write(self.fid + "," + self.ip + ", Timed out\r")
-                return 1
+            self.log_error("Timed out")
+            return 1
         except socket.gaierror:
             print(self.ip + " Socket Error\n")
-            with open("logs\\connection_errors.txt", "a") as file:
-                file.write(self.fid + "," + self.ip + ", Socket Error\r")
-                return 1
+            self.log_error("Socket Error")
+            return 1
         except ConnectionRefusedError:
             print(self.ip + " Refused connection\n")
-            with open("logs\\connection_errors.txt", "a") as file:
-                file.write(self.fid + "," + self.ip + ", Refused connection\r")
-                return 1
+            self.log_error("Refused connection")
+            return 1
+        except OSError:
+            print(self.ip + " Unreachable\n")
+            self.log_error("Unreachable")
+            return 1
             
         print("Connected to " + self.fid + " " + self.ip)
         return 0
@@ -61,20 +180,55 @@ class Recloser:
             print("Problem closing connection to " + self.fid + " " + self.ip)
             
             
+    def bytes_received(self):
+        """Returns the number of bytes received over the Telnet session so far"""
+        return self.tn.bytes_received if hasattr(self, "tn") else 0
+    
+    
+    def log_error(self, reason):
+        """Records a connection error for the recloser"""
+        self.errors.append(reason)
+        if self.results is not None:
+            self.results.write_error(self.fid, self.ip, reason)
+    
+    
+    def send_command(self, command):
+        """Discards any unread output, such as a greeting or stale prompt, and sends a command to the recloser"""
+        self.tn.read_very_eager()
+        self.tn.write(command + b"\r\n")
+    
+    
+    def read_until(self, patterns, timeout):
+        """Reads until one of the patterns is received or the timeout expires, returns the pattern index (-1 on timeout) and the output"""
+        index, match, output = self.tn.expect(patterns, timeout)
+        return index, output.decode('ascii', 'ignore')
+    
+    
+    @timed
     def retrieve_model(self):
         """Retrieves model number of the recloser"""
-        self.tn.write(b"ID" + b"\r\n")
-        sleep(self.WAIT)
         try:
-            output = self.tn.read_very_eager().decode('ascii')
-        except ConnectionResetError:
+            self.send_command(b"ID")
+            output = self.read_until([ID_END], self.COMMAND_TIMEOUT)[1]
+        except (ConnectionResetError, EOFError):
             print("Recloser refused connection. Logged in to many times in a row")
+            self.log_error("Lockout")
             self.tn.close()
+            output = ""
+        except OSError:
+            print("Connection lost")
+            self.log_error("Connection lost")
+            self.tn.close()
+            output = ""
         try:
             self.model = output.split("SEL-")[1].split("-")[0]
         except:
             print("Connection unavailable, likely a Form 6\n")
             self.tn.close()
+        self.config_id = id_field(output, "CID")
+        self.firmware = id_field(output, "FID")
+        if self.model in SETTING_NAMES:
+            self.identified = time()
         if self.model == "651R":
             print("Model: " + self.model, end=" ")
             return 0
@@ -88,26 +242,61 @@ class Recloser:
             return 1
             
             
+    def load_inventory(self):
+        """Takes the model from the inventory instead of sending ID, returns 0 if the recloser has a valid entry"""
+        
+        # An incremental sweep needs the configuration ID, which only ID reports
+        if self.inventory is None or self.config_cache is not None:
+            return 1
+        entry = self.inventory.get(self.fid)
+        if entry is None or entry["ip"] != self.ip:
+            return 1
+        self.model = entry["model"]
+        self.firmware = entry["firmware"]
+        self.identified = entry["identified"]
+        print("Model: " + self.model + " (inventory)", end=" ")
+        return 0
+    
+    
+    def update_inventory(self, succeeded):
+        """Records a successful retrieval in the inventory, or drops the recloser's entry after a failed one"""
+        if self.inventory is None:
+            return
+        if succeeded and self.model in SETTING_NAMES:
+            self.inventory[self.fid] = {"ip": self.ip, "model": self.model, "firmware": self.firmware,
+                                        "identified": self.identified, "last_success": time()}
+        else:
+            self.inventory.pop(self.fid, None)
+    
+    
+    @timed
     def login(self):
         """Logs into a recloser using the password contained in PASSWORD"""
         try:
-            self.tn.write(b"ACC" + b"\r\n")
-            sleep(self.WAIT)
-            self.tn.write(self.password.encode('ascii') + b"\r\n")
-            sleep(self.WAIT)
-            return 0
+            self.send_command(b"ACC")
+            index = self.read_until([PASSWORD_PROMPT, ACCESS_PROMPT], self.COMMAND_TIMEOUT)[0]
+            if index == 0:
+                self.tn.write(load_password().encode('ascii') + b"\r\n")
+                index = self.read_until([PASSWORD_PROMPT, ACCESS_PROMPT], self.COMMAND_TIMEOUT)[0]
+            if index == 1:
+                return 0
+            print("Login failed\n")
+            self.log_error("Login failed")
+            return 1
         except AttributeError:
-            with open("logs\\connection_errors.txt", "a") as file:
-                file.write(self.fid + "," + self.ip + ", NoneType\r")
-                return 1
+            self.log_error("NoneType")
+            return 1
+        except (OSError, EOFError):
+            self.log_error("Connection lost")
+            return 1
             
     
+    @timed
     def retrieve_group(self):
         """Retrieves the group number of the recloser"""
         try:
-            self.tn.write(b"GRO" + b"\r\n")
-            sleep(self.WAIT)
-            output = self.tn.read_very_eager().decode('ascii')
+            self.send_command(b"GRO")
+            output = self.read_until([GROUP_END], self.COMMAND_TIMEOUT)[1]
             self.group = int((output.split("Active Group = ")[1].split("=>")[0])[0])
             if self.group > 0 and self.group < 9:
                 print("Group: " + str(self.group))
@@ -115,491 +304,1085 @@ class Recloser:
             else:
                 print("Group number is nonsensicle")
                 return 1
+        except (OSError, EOFError):
+            print("Connection lost\n")
+            self.log_error("Connection lost")
+            self.group = 99
+            return 1
         except:
             print("Unable to obtain group number\n")
             self.group = 99
             return 1
     
     
+    @timed
     def retrieve_setpoints(self):
-        """Retrieves the setpoints for the recloser"""
+        """Retrieves the setpoints for the recloser, those of every group when all_groups is set
         
-        if self.model == "651R":
-            self.tn.write(b"SHO " + str(self.group).encode('ascii') + b"\r\n")
-            sleep(self.WAIT * 2)
-            self.setpoints = self.tn.read_very_eager().decode('ascii')
-            file_name = "setpoints\\RECL " + self.fid + ".txt"
-            with open(file_name, "w") as file:
-                file.write(self.setpoints)
-                
-        if self.model == "351R":
-            self.tn.write(b"SHO " + str(self.group).encode('ascii') + b"\r\n")
-            sleep(self.WAIT * 4)
-            self.tn.write(b"\r\n")
-            sleep(self.WAIT * 4)
-            self.tn.write(b"\r\n")
-            sleep(self.WAIT * 4)
-            self.setpoints = self.tn.read_very_eager().decode('ascii')
-            file_name = "setpoints\\RECL " + self.fid + ".txt"
-            with open(file_name, "w") as file:
-                file.write(self.setpoints)
-                
-        if self.model == "351RS":
-            self.tn.write(b"SHO " + str(self.group).encode('ascii') + b"\r\n")
-            sleep(self.WAIT * 4)
-            self.tn.write(b"\r\n")
-            sleep(self.WAIT * 4)
-            self.tn.write(b"\r\n")
-            sleep(self.WAIT * 4)
-            self.setpoints = self.tn.read_very_eager().decode('ascii')
-            file_name = "setpoints\\RECL " + self.fid + ".txt"
-            with open(file_name, "w") as file:
-                file.write(self.setpoints)
-            
-            
-    def parse_ctr(self):
-        """Parses the CTR for the recloser"""
+        Each group is listed with its own SHO over the same session, the active group first.
+        """
         
-        if self.model == "651R":
-            try:
-                self.ctr = int(float(self.setpoints.split("CTR")[1].split(":=")[1].strip()))
-                return 0
-            except:
-                print("CTR Parsing Error")
-                self.ctr = 999999
-                with open("logs\\connection_errors.txt", "a") as file:
-                    file.write(self.fid + "," + self.ip + ", No CTR\r")
-                return 1
-            
-        if self.model == "351R":
-            try:
-                self.ctr = int(float(self.setpoints.split("CTR")[1].split("=")[1].strip()))
-                return 0
-            except:
-                print("CTR Parsing Error")
-                self.ctr = 999999
-                with open("logs\\connection_errors.txt", "a") as file:
-                    file.write(self.fid + "," + self.ip + ", No CTR\r")
-                return 1
-            
-        if self.model == "351RS":
-            try:
-                self.ctr = int(float(self.setpoints.split("CTR")[1].split("=")[1].split("PTR")[0].strip()))
-                return 0
-            except:
-                print("CTR Parsing Error")
-                self.ctr = 999999
-                with open("logs\\connection_errors.txt", "a") as file:
-                    file.write(self.fid + "," + self.ip + ", No CTR\r")
-                return 1
-            
-            
-# PHASE PHASE PHASE PHASE PHASE PHASE PHASE PHASE PHASE PHASE PHASE PHASE PHASE PHASE PHASE PHASE PHASE PHASE PHASE PHASE
-
-
-    def parse_phPU(self) -> int:
-        """Parses the setpoints to find phase PU"""
+        if self.model not in ("651R",) + PAGED_MODELS:
+            return 1
         
-        if self.model == "651R":
-            try:
-                self.phPU = self.setpoints.split("51PJP")[1].split(":=")[1].split("51PJC")[0].strip()
-                print("Phase: " + str(float(self.phPU) * self.ctr), end=' ')
-                return 0
-            except:
-                print("Could not obtain phase pickup")
-                return 1
-            
-        elif self.model == "351R":
-            try:
-                self.phPU = self.setpoints.split("51P1P =")[1].split("51P1C")[0].strip()
-                print("Phase: " + str(float(self.phPU) * self.ctr), end=' ')
-                return 0
-            except:
-                print("Could not obtain phase pickup")
-                return 1
-            
-        elif self.model == "351RS":
-            try:
-                self.phPU = self.setpoints.split("51P1P")[1].split("=")[1].split("51P1C")[0].strip()
-                print("Phase: " + str(float(self.phPU) * self.ctr), end=' ')
-                return 0
-            except:
-                print("Could not obtain phase pickup")
-                return 1
-            
-            
-    def parse_phFC(self) -> int:
-        """Parses the setpoints to find phase fast curve"""
+        groups = [self.group]
+        if self.all_groups:
+            groups += [group for group in range(1, GROUP_COUNTS[self.model] + 1) if group != self.group]
+        file_names = {group: setpoint_file_name(self.fid, None if group == self.group else group) for group in groups}
         
-        if self.model == "651R":
-            try:
-                self.phFC = self.setpoints.split("51PJC")[1].split(":=")[1].split("51PJTD")[0].strip()
-                print(self.phFC, end=' ')
+        # Reuses the saved setpoints when the configuration and active group match the last sweep
+        # and it captured every group wanted under that configuration, in full if full_listing is set
+        if self.config_cache is not None and self.config_id:
+            entry = self.config_cache.get(self.fid, {})
+            if (entry.get("cid") == self.config_id and entry.get("group") == self.group and set(groups) <= set(entry.get("groups", ()))
+                    and (entry.get("full") or not self.full_listing) and all(os.path.exists(file_name) for file_name in file_names.values())):
+                self.group_files = file_names
+                self.group_settings = {group: tokenize_setpoints(read_saved_listing(file_name)) for group, file_name in file_names.items()}
+                print("Configuration unchanged, using saved setpoints")
                 return 0
-            except:
-                print("Could not obtain phase fast curve")
-                return 1
-        elif self.model == "351R":
-            try:
-                self.phFC = self.setpoints.split("51P1C =")[1].split("51P1TD=")[0].strip()
-                print(self.phFC, end=' ')
-                return 0
-            except:
-                print("Could not obtain phase fast curve")
-                return 1
-            
-        elif self.model == "351RS":
-            try:
-                self.phFC = self.setpoints.split("51P1C")[1].split("=")[1].split("51P1TD")[0].strip()
-                print(self.phFC, end=' ')
-                return 0
-            except:
-                print("Could not obtain phase fast curve")
-                return 1
+        
+        # Listings are kept on disk only, parse_recloser reads them back if it needs them
+        self.group_files = {}
+        self.group_settings = {}
+        captured = []
+        for group, file_name in file_names.items():
+            with open(file_name, "wb") as file:
+                complete, settings = self.read_listing(group, file)
+            if complete or group == self.group:
+                # A truncated active group is still parsed for the settings it holds
+                self.group_files[group] = file_name
+                self.group_settings[group] = settings
+            if not complete:
+                # The session is unlikely to list any further group
+                print("Setpoint listing of group " + str(group) + " truncated\n")
+                self.log_error("Truncated setpoints" if group == self.group else "Truncated setpoints group " + str(group))
+                break
+            captured.append(group)
+        
+        if self.config_cache is not None:
+            self.config_cache.pop(self.fid, None)
+        if self.group not in captured:
+            return 1
+        if len(captured) == len(groups) and self.config_cache is not None and self.config_id:
+            self.config_cache[self.fid] = {"cid": self.config_id, "group": self.group, "groups": sorted(captured), "full": self.full_listing}
+        return 0
     
     
-    def parse_phFTD(self) -> int:
-        """Parses the setpoints to find phase fast curve time dial"""
+    def read_listing(self, group, file):
+        """Sends SHO for a group and reads the listing as it arrives, returns (complete, settings)
         
-        if self.model == "651R":
-            try:
-                self.phFTD = self.setpoints.split("51PJTD")[1].split(":=")[1].split("51PJCT")[0].strip()
-                try: 
-                    self.phFTD = self.phFTD.split("51PJRS")[0].strip()
-                    print(self.phFTD, end=' ')
-                    return 0
-                except:
-                    print(self.phFTD, end=' ')
-                    return 0
-            except:
-                print("Could not obtain phase fast time dial")
-                return 1
-            
-        elif self.model == "351R":
-            try:
-                self.phFTD = self.setpoints.split("51P1TD=")[1].split("51P1CT")[0].strip()
-                print(self.phFTD, end=' ')
-                return 0
-            except:
-                print("Could not obtain phase fast time dial")
-                return 1
-            
-        elif self.model == "351RS":
-            try:
-                self.phFTD = self.setpoints.split("51P1TD")[1].split("=")[1].split("51P1CT")[0].strip()
-                print(self.phFTD, end=' ')
-                return 0
-            except:
-                print("Could not obtain phase fast time dial")
-                return 1
+        Received bytes are written to the file and tokenized line by line as they arrive, so
+        only the last few bytes are held to find the prompt. Only a prompt after the echo of
+        the SHO command ends the listing. Once every setting the model needs has been seen,
+        the rest of a paged listing is cancelled instead of paged through, unless full_listing
+        is set.
+        """
+        scanner = SettingScanner(() if self.full_listing else SETTING_NAMES[self.model].values())
+        deadline = monotonic() + self.SETPOINT_TIMEOUT
+        echo = re.compile(rb"SHO[ \t]*" + str(group).encode('ascii'))
+        tail = b""
+        echoed = False
+        waiting = False
+        complete = False
+        cancelled = False
+        try:
+            self.send_command(b"SHO " + str(group).encode('ascii'))
+            while not complete and monotonic() < deadline:
+                wait = deadline - monotonic()
+                if self.model in PAGED_MODELS:
+                    wait = min(wait, self.PAGE_WAIT)
+                data = self.tn.read_some(max(wait, 0))
+                file.write(data)
+                found = scanner.feed(data)
+                
+                # The prompt may straddle two reads, so the end of the last one is searched too
+                window = tail + data
+                if not echoed:
+                    # A prompt before the echo answers an earlier command, not this listing
+                    match = echo.search(window)
+                    echoed = match is not None
+                    if echoed:
+                        window = window[match.end():]
+                complete = echoed and PROMPT.search(window) is not None
+                tail = window[-PROMPT_TAIL:]
+                if data:
+                    waiting = False
+                if complete or cancelled or self.model not in PAGED_MODELS:
+                    continue
+                if found and not self.full_listing:
+                    # The relay ends a cancelled listing at the prompt
+                    self.tn.write(CANCEL)
+                    cancelled = True
+                elif not data and echoed and not waiting:
+                    # Sends a CRLF once a paged model stalls at the end of a page, and not
+                    # again until the next page arrives, since a spare CRLF makes a stray prompt
+                    self.tn.write(b"\r\n")
+                    waiting = True
+        except EOFError:
+            pass
+        except OSError:
+            self.log_error("Connection lost")
+        scanner.feed(b"\n")
+        return complete, scanner.settings
             
             
-    def parse_phSC(self) -> int:
-        """Parses the setpoints to find phase slow curve"""
+    @timed
+    def parse_all_settings(self) -> int:
+        """Parses the protective element settings out of the setpoints, unless they were tokenized as they arrived"""
+        if not self.settings:
+            self.settings = tokenize_setpoints(self.setpoints)
+        if self.model not in SETTING_NAMES:
+            return 1
+        names = SETTING_NAMES[self.model]
+        result = 0
         
-        if self.model == "651R":
-            try:
-                self.phSC = self.setpoints.split("51PKC")[1].split(":=")[1].split("51PKTD")[0].strip()
-                print(self.phSC, end=' ')
-                return 0
-            except:
-                print("Could not obtain phase slow curve")
-                return 1
-            
-        elif self.model == "351R":
-            try:
-                self.phSC = self.setpoints.split("51P2C =")[1].split("51P2TD")[0].strip()
-                print(self.phSC, end=' ')
-                return 0
-            except:
-                print("Could not obtain phase slow curve")
-                return 1
-            
-        elif self.model == "351RS":
-            try:
-                self.phSC = self.setpoints.split("51P2C")[1].split("=")[1].split("51P2TD")[0].strip()
-                print(self.phSC, end=' ')
-                return 0
-            except:
-                print("Could not obtain phase slow curve")
-                return 1
-            
-            
-    def parse_phSTD(self) -> int:
-        """Parses the setpoints to find phase slow curve time dial"""
+        try:
+            self.ctr = int(float(self.settings[names["ctr"]]))
+        except (KeyError, ValueError):
+            print("CTR Parsing Error")
+            self.ctr = 999999
+            self.log_error("No CTR")
+            result = 1
         
-        if self.model == "651R":
+        for field in PHASE_FIELDS + GROUND_FIELDS:
             try:
-                self.phSTD = self.setpoints.split("51PKTD")[1].split(":=")[1].split("51PKRS")[0].strip()
-                try:
-                    self.phSTD = self.phSTD.split("51PKCT")[0].strip()
-                    print(self.phSTD)
-                    return 0
-                except:
-                    print(self.phSTD)
-                    return 0
-            except:
-                print("Could not obtain slow curve time dial")
-                return 1
-            
-        elif self.model == "351R":
-            try:
-                self.phSTD = self.setpoints.split("51P2TD=")[1].split("51P2CT=")[0].strip()
-                try:
-                    self.phSTD = self.phSTD.split("51P2RS")[0].strip()
-                    print(self.phSTD)
-                    return 0
-                except:
-                    print(self.phSTD)
-                    return 0
-            except:
-                print("Could not obtain slow curve time dial")
-                return 1
-            
-        elif self.model == "351RS":
-            try:
-                self.phSTD = self.setpoints.split("51P2TD")[1].split("=")[1].split("51P2RS")[0].strip()
-                try:
-                    self.phSTD = self.phSTD.split("51P2RS")[0].strip()
-                    print(self.phSTD + "\n")
-                    return 0
-                except:
-                    print(self.phSTD)
-                    return 0
-            except:
-                print("Could not obtain slow curve time dial")
-                return 1
+                setattr(self, field, self.settings[names[field]])
+            except KeyError:
+                print("Could not obtain " + SETTING_DESCRIPTIONS[field])
+                result = 1
         
+        self.print_settings("Phase: ", PHASE_FIELDS)
+        if self.model != "351RS":
+            self.print_settings("Ground: ", GROUND_FIELDS)
+        print()
+        return result
+    
+    
+    def clear_settings(self):
+        """Resets the parsed settings to their defaults, so a group is never written with another's"""
+        self.ctr = 1000
+        for field in PHASE_FIELDS + GROUND_FIELDS:
+            setattr(self, field, 1)
+    
+    
+    def print_settings(self, label, fields):
+        """Prints a pickup in primary amps followed by the curve and time dial settings"""
+        try:
+            pickup = str(float(getattr(self, fields[0])) * self.ctr)
+        except ValueError:
+            pickup = str(getattr(self, fields[0]))
+        print(label + " ".join([pickup] + [str(getattr(self, field)) for field in fields[1:]]))
 
-# GROUND GROUND GROUND GROUND GROUND GROUND GROUND GROUND GROUND GROUND GROUND GROUND GROUND GROUND GROUND GROUND
 
-    def parse_gPU(self) -> int:
-        """Parses the setpoints to find ground pickup"""
-        
-        if self.model == "651R":
-            try:
-                self.gPU = self.setpoints.split("51G1JP")[1].split(":=")[1].split("51G1JC")[0].strip()
-                print("Ground: " + str(float(self.gPU) * self.ctr), end=' ')
-                return 0
-            except:
-                print("Could not obtain ground pickup")
-                return 1
-            
-        elif self.model == "351R":
-            try:
-                self.gPU = self.setpoints.split("51G1P =")[1].split("51G1C")[0].strip()
-                print("Ground: " + str(float(self.gPU) * self.ctr), end=' ')
-                return 0
-            except:
-                print("Could not obtain ground pickup")
-                return 1
-            
-        elif self.model == "351RS":
-            try:
-                self.gPU = self.phPU
-                return 0
-            except:
-                print("Could not obtain ground pickup")
-                return 1
-            
-            
-    def parse_gFC(self) -> int:
-        """Parses the setpoints to find ground fast curve"""
-        
-        if self.model == "651R":
-            try:
-                self.gFC = self.setpoints.split("51G1JC")[1].split(":=")[1].split("51G1JTD")[0].strip()
-                print(self.gFC, end=' ')
-                return 0
-            except:
-                print("Could not obtain ground fast curve")
-                return 1
-            
-        elif self.model == "351R":
-            try:
-                self.gFC = self.setpoints.split("51G1C =")[1].split("51G1TD=")[0].strip()
-                print(self.gFC, end=' ')
-                return 0
-            except:
-                print("Could not obtain ground fast curve")
-                return 1
-            
-        elif self.model == "351RS":
-            try:
-                self.gFC = self.phFC
-                return 0
-            except:
-                print("Could not obtain ground fast curve")
-                return 1
+@lru_cache(maxsize=None)
+def load_password():
+    """Returns the password contained in PASSWORD, read once per process"""
+    with open("PASSWORD", "r") as file:
+        return file.read()
+
+
+def subnet(ip):
+    """Returns the /24 subnet of an IPv4 address, used as the gateway when ip_list.csv names none"""
+    return ip.rsplit(".", 1)[0] + ".0/24" if ip.count(".") == 3 else ip
+
+
+def id_field(output, name):
+    """Returns a field of an ID response, such as CID or FID, or "" if the response has none"""
+    try:
+        return output.split('"' + name + '=')[1].split('"')[0]
+    except IndexError:
+        return ""
+
+
+def setpoint_file_name(fid, group=None):
+    """Returns the name of the file the recloser's raw setpoints are saved to, or those of an inactive group"""
+    return "setpoints\\RECL " + fid + ("" if group is None else " G" + str(group)) + ".txt"
+
+
+def read_saved_listing(file_name):
+    """Returns a saved SHO listing, decoded as it was received"""
+    with open(file_name, "rb") as file:
+        return file.read().decode('ascii', 'ignore')
+
+
+def infer_model(settings):
+    """Returns the model whose settings are all present, or None"""
+    for model, names in SETTING_NAMES.items():
+        if all(name in settings for name in names.values()):
+            return model
+    return None
+
+
+class SettingScanner:
+    """Tokenizes a SHO listing line by line as it arrives, keeping the first occurrence of each setting"""
+    def __init__(self, required=()):
+        self.settings = {}
+        self.required = set(required)
+        self.partial = b""
     
     
-    def parse_gFTD(self) -> int:
-        """Parses the setpoints to find ground fast curve time dial"""
-        
-        if self.model == "651R":
-            try:
-                self.gFTD = self.setpoints.split("51G1JTD")[1].split(":=")[1].split("51G1JCT")[0].strip()
+    def feed(self, data):
+        """Tokenizes the lines data completes, returns True once every required setting has been seen"""
+        lines = (self.partial + data).split(b"\n")
+        self.partial = lines.pop()
+        for line in lines:
+            for match in SETTING.finditer(line.decode('ascii', 'ignore')):
+                if match.group(1) not in self.settings:
+                    self.settings[match.group(1)] = match.group(2)
+                    self.required.discard(match.group(1))
+        return not self.required
+
+
+def tokenize_setpoints(setpoints):
+    """Returns every setting in a SHO listing as a dictionary of name to value, keeping the first occurrence of a name"""
+    settings = {}
+    for match in SETTING.finditer(setpoints):
+        settings.setdefault(match.group(1), match.group(2))
+    return settings
+
+
+class ResultWriter:
+    """Keeps a sweep's output and connection error files open and writes to them in batches
+    
+    Rows may be written from any thread. Buffered rows are written once batch_size have
+    accumulated and at least every interval seconds, so the files never lag far behind.
+    Rows are also added to the store, if one is given.
+    
+    If a journal is given, the FID of every row and error is appended to it once the row or
+    error is in its file, so the journal never claims a result that a crash could lose.
+    """
+    def __init__(self, output_file_name, error_file_name=ERROR_LOG, batch_size=50, interval=5, store=None, journal_file_name=None):
+        self.output = open(output_file_name, "a", newline='')
+        self.output_writer = writer(self.output)
+        self.errors = open(error_file_name, "a")
+        self.batch_size = batch_size
+        self.interval = interval
+        self.store = store
+        self.journal = open(journal_file_name, "a") if journal_file_name else None
+        self.rows = []
+        self.error_lines = []
+        self.failures = []
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+        self.flusher = threading.Thread(target=self.flush_periodically, daemon=True)
+        self.flusher.start()
+    
+    
+    def write_row(self, row):
+        """Buffers a row of the output file"""
+        self.write_rows([row])
+    
+    
+    def write_rows(self, rows):
+        """Buffers rows of the output file, which are written out together"""
+        with self.lock:
+            self.rows += rows
+            if len(self.rows) >= self.batch_size:
+                self.flush_buffers()
+    
+    
+    def write_error(self, fid, ip, reason):
+        """Buffers a line of the connection error file"""
+        with self.lock:
+            self.error_lines.append(fid + "," + ip + ", " + reason + "\r")
+            self.failures.append((fid, reason))
+            if len(self.error_lines) >= self.batch_size:
+                self.flush_buffers()
+    
+    
+    def flush_buffers(self):
+        """Writes out the buffered rows and errors, the lock must be held"""
+        entries = []
+        if self.rows:
+            self.output_writer.writerows(self.rows)
+            self.output.flush()
+            if self.store is not None:
+                self.store.add_rows(self.rows)
+            entries += [{"fid": row[0], "status": "done"} for row in self.rows]
+            self.rows = []
+        if self.error_lines:
+            self.errors.write("".join(self.error_lines))
+            self.errors.flush()
+            entries += [{"fid": fid, "status": "failed", "reason": reason} for fid, reason in self.failures]
+            self.error_lines = []
+            self.failures = []
+        if self.journal is not None and entries:
+            self.journal.write("".join(json.dumps(entry) + "\n" for entry in entries))
+            self.journal.flush()
+    
+    
+    def flush(self):
+        """Writes out everything buffered so far"""
+        with self.lock:
+            self.flush_buffers()
+    
+    
+    def flush_periodically(self):
+        """Flushes every interval seconds until the writer is closed"""
+        while not self.closed.wait(self.interval):
+            self.flush()
+    
+    
+    def close(self):
+        """Flushes and closes the files"""
+        self.closed.set()
+        self.flusher.join()
+        self.flush()
+        self.output.close()
+        self.errors.close()
+        if self.journal is not None:
+            self.journal.close()
+
+
+def percentile(values, q):
+    """Returns the nearest-rank q-th percentile of the values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+def phase_summary(reclosers):
+    """Summarises the time and bytes of each phase across the reclosers"""
+    summary = {}
+    for phase in PHASES:
+        seconds = [recloser.metrics[phase]["seconds"] for recloser in reclosers if phase in recloser.metrics]
+        received = [recloser.metrics[phase]["bytes"] for recloser in reclosers if phase in recloser.metrics]
+        summary[phase] = {"devices": len(seconds), "total": sum(seconds), "mean": sum(seconds) / len(seconds) if seconds else 0.0,
+                          "p50": percentile(seconds, 50), "p95": percentile(seconds, 95), "max": max(seconds, default=0.0),
+                          "bytes": sum(received)}
+    return summary
+
+
+def write_metrics(reclosers, file_name):
+    """Writes per-device and per-model phase timings for a sweep to a JSON file"""
+    swept = [recloser for recloser in reclosers if recloser.metrics]
+    models = {}
+    for recloser in swept:
+        models.setdefault(recloser.model if recloser.model in SETTING_NAMES else "unknown", []).append(recloser)
+    metrics = {
+        "devices": len(swept),
+        "phases": phase_summary(swept),
+        "models": {model: {"devices": len(group), "phases": phase_summary(group),
+                           "p95": percentile([sum(phase["seconds"] for phase in recloser.metrics.values()) for recloser in group], 95)}
+                   for model, group in models.items()},
+        "reclosers": [{"fid": recloser.fid, "ip": recloser.ip, "model": str(recloser.model), "phases": recloser.metrics} for recloser in swept],
+    }
+    with open(file_name, "w") as file:
+        json.dump(metrics, file, indent=1)
+
+
+def record_attempts(attempts, reclosers, now):
+    """Records the outcome of every recloser a sweep attempted"""
+    for recloser in reclosers:
+        if not recloser.metrics and not recloser.errors:
+            continue
+        entry = attempts.setdefault(recloser.fid, {"last_success": 0, "last_failure": 0, "failures": 0})
+        if "parse_all_settings" in recloser.metrics:
+            entry["last_success"] = now
+            entry["failures"] = 0
+        else:
+            entry["last_failure"] = now
+            entry["failures"] += 1
+
+
+def load_durations(runs=5):
+    """Returns the mean seconds per recloser of each model, and the model of each FID, from the latest metrics files"""
+    samples = {}
+    models = {}
+    for file_name in sorted(glob.glob(METRICS_FILES))[-runs:]:
+        metrics = load_json(file_name)
+        for model, summary in metrics.get("models", {}).items():
+            if summary["devices"]:
+                samples.setdefault(model, []).append(sum(phase["mean"] for phase in summary["phases"].values()))
+        models.update({entry["fid"]: entry["model"] for entry in metrics.get("reclosers", [])})
+    return {model: sum(seconds) / len(seconds) for model, seconds in samples.items()}, models
+
+
+def prioritise(reclosers, attempts, durations, models, stale_after, now):
+    """Orders reclosers for a sweep with a time budget and returns them with the expected seconds of each
+    
+    Reclosers with no success within stale_after seconds come first, then those whose last
+    attempt failed, then the rest. Within each, the quickest expected go first, so the most
+    reclosers are collected before the budget runs out.
+    """
+    default = sum(durations.values()) / len(durations) if durations else 30.0
+    estimates = {}
+    keys = {}
+    for recloser in reclosers:
+        entry = attempts.get(recloser.fid, {"last_success": 0, "last_failure": 0})
+        estimates[recloser.fid] = durations.get(models.get(recloser.fid), default)
+        stale = now - entry["last_success"] > stale_after
+        failed = entry["last_failure"] > entry["last_success"]
+        keys[recloser.fid] = (not stale, not failed, estimates[recloser.fid], entry["last_success"])
+    return sorted(reclosers, key=lambda recloser: keys[recloser.fid]), estimates
+
+
+class Budget:
+    """Tracks a sweep's time budget and defers reclosers that are not expected to finish inside it"""
+    def __init__(self, seconds, estimates, concurrency):
+        self.deadline = monotonic() + seconds
+        self.estimates = estimates
+        self.concurrency = concurrency
+        self.pending = sum(estimates.values())
+        self.deferred = []
+    
+    
+    def start(self, recloser):
+        """Returns True if the recloser is expected to finish before the deadline, otherwise defers it"""
+        estimate = self.estimates.get(recloser.fid, 0.0)
+        self.pending = max(self.pending - estimate, 0.0)
+        if monotonic() + estimate > self.deadline:
+            self.deferred.append(recloser)
+            return False
+        print("About %.1f min of work left, %.1f min left in the window" % (self.pending / self.concurrency / 60, (self.deadline - monotonic()) / 60))
+        return True
+
+
+def load_json(file_name):
+    """Returns the contents of a JSON file, or an empty dictionary if it does not exist yet"""
+    try:
+        with open(file_name, "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def merge_json(file_name, data, fids):
+    """Writes the entries of the FIDs to a JSON file other shards also write, keeping their entries
+    
+    An exclusive lock file serialises shards finishing at once. A lock left by a crashed shard
+    is taken over after 30 seconds.
+    """
+    lock = file_name + ".lock"
+    deadline = monotonic() + 30
+    while True:
+        try:
+            descriptor = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            if monotonic() > deadline:
+                descriptor = os.open(lock, os.O_CREAT | os.O_WRONLY)
+                break
+            sleep(0.1)
+    try:
+        merged = load_json(file_name)
+        for fid in fids:
+            if fid in data:
+                merged[fid] = data[fid]
+            else:
+                merged.pop(fid, None)
+        save_json(file_name, merged)
+    finally:
+        os.close(descriptor)
+        os.remove(lock)
+
+
+def save_state(file_name, data, fids=None):
+    """Saves a JSON file of per-FID state, only the entries of the FIDs if a shard gives them"""
+    if fids is None:
+        save_json(file_name, data)
+    else:
+        merge_json(file_name, data, fids)
+
+
+def save_json(file_name, data):
+    """Writes data to a JSON file, replacing it only once the new contents are complete"""
+    with open(file_name + ".tmp", "w") as file:
+        json.dump(data, file, indent=1)
+    os.replace(file_name + ".tmp", file_name)
+
+
+def start_journal(file_name, timestamp):
+    """Starts a new checkpoint journal for the sweep with the timestamp"""
+    with open(file_name, "w") as file:
+        file.write(json.dumps({"timestamp": timestamp}) + "\n")
+
+
+def load_journal(file_name):
+    """Returns the timestamp and completed FIDs of the journaled sweep, or (None, set()) if there is none
+    
+    A FID counts as completed once its row was written, even if an earlier attempt failed.
+    A line cut short by a crash is ignored and ended, so entries appended later start on a new line.
+    """
+    timestamp = None
+    done = set()
+    line = "\n"
+    try:
+        with open(file_name, "r") as file:
+            for line in file:
                 try:
-                    self.gFTD = self.gFTD.split("51G1JRS")[0].strip()
-                    print(self.gFTD, end=' ')
-                    return 0
-                except:
-                    print(self.gFTD, end=' ')
-                    return 0
-            except:
-                print("Could not obtain ground fast time dial")
-                return 1
-            
-        elif self.model == "351R":
-            try:
-                self.gFTD = self.setpoints.split("51G1TD=")[1].split("51G1CT=")[0].strip()
-                print(self.gFTD, end=' ')
-                return 0
-            except:
-                print("Could not obtain ground fast time dial")
-                return 1
-            
-        elif self.model == "351RS":
-            try:
-                self.gFTD = self.phFTD
-                return 0
-            except:
-                print("Could not obtain ground fast time dial")
-                return 1            
-            
-            
-    def parse_gSC(self) -> int:
-        """Parses the setpoints to find ground slow curve"""
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if "timestamp" in entry:
+                    timestamp = entry["timestamp"]
+                elif entry.get("status") == "done":
+                    done.add(entry["fid"])
+    except FileNotFoundError:
+        return None, done
+    if not line.endswith("\n"):
+        with open(file_name, "a") as file:
+            file.write("\n")
+    return timestamp, done
+
+
+def format_timestamp(moment):
+    """Returns the timestamp written to the output file for a datetime"""
+    return moment.strftime("%Y%m%d") + " " + moment.strftime("%H") + ":" + moment.strftime("%M")
+
+
+def output_file_name(timestamp):
+    """Returns the name of the output file for a sweep"""
+    return "output_" + timestamp.replace(" ","-").replace(":","") + ".csv"
+
+
+def shard_of(fid, count):
+    """Returns the shard, from 1 to count, that a FID belongs to, the same in every process and on every host"""
+    return int.from_bytes(hashlib.sha1(fid.encode('utf-8')).digest()[:8], "big") % count + 1
+
+
+def shard_file_name(file_name, suffix):
+    """Returns a per-shard file name, output_<stamp>.csv becoming output_<stamp><suffix>.csv"""
+    root, extension = os.path.splitext(file_name)
+    return root + suffix + extension
+
+
+def shard_argument(value):
+    """Parses a shard given as I/N"""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise ArgumentTypeError("expected I/N, for example 2/4")
+    if not 1 <= index <= count:
+        raise ArgumentTypeError("expected I/N with I from 1 to N")
+    return index, count
+
+
+def sweep_id_argument(value):
+    """Parses a sweep ID given as YYYYMMDD-HHMM and returns the sweep's timestamp"""
+    try:
+        return format_timestamp(datetime.strptime(value, "%Y%m%d-%H%M"))
+    except ValueError:
+        raise ArgumentTypeError("expected YYYYMMDD-HHMM, for example 20240101-0600")
+
+
+def merge_shards(timestamp, count, partial=False):
+    """Combines the per-shard output files and error logs of a sweep, returns the numbers of the missing shards
+    
+    A row is kept once per FID and group, and errors are kept only for reclosers with no row.
+    Nothing is written while a shard is missing, unless partial is set.
+    """
+    stamp = timestamp.replace(" ","-").replace(":","")
+    outputs = {index: shard_file_name(output_file_name(timestamp), "_shard" + str(index) + "of" + str(count)) for index in range(1, count + 1)}
+    missing = [index for index, output in outputs.items() if not os.path.exists(output)]
+    if missing and not partial:
+        return missing
+    
+    rows = {}
+    errors = {}
+    for index, output in outputs.items():
+        if index in missing:
+            continue
+        suffix = "_shard" + str(index) + "of" + str(count)
+        with open(output, "r", newline='') as file:
+            for row in reader(file):
+                rows.setdefault((row[0], row[3]), row)
+        error_log = shard_file_name(ERROR_LOG, "_" + stamp + suffix)
+        if os.path.exists(error_log):
+            with open(error_log, "r", newline='') as file:
+                for line in file.read().split("\r"):
+                    if line.strip():
+                        errors.setdefault(line, line.split(",")[0])
+    
+    with open(output_file_name(timestamp), "w", newline='') as file:
+        writer(file).writerows(rows.values())
+    succeeded = {fid for fid, group in rows}
+    with open(ERROR_LOG, "w") as file:
+        file.write("".join(line + "\r" for line, fid in errors.items() if fid not in succeeded))
+    print("Merged " + str(len(rows)) + " rows from " + str(count - len(missing)) + " of " + str(count) + " shards into " + output_file_name(timestamp))
+    return missing
+
+
+def output_row(recloser, timestamp):
+    """Returns the recloser's row of the output file"""
+    return [recloser.fid, recloser.model, recloser.ip, recloser.group, recloser.ctr, recloser.phPU, recloser.phFC, recloser.phFTD, recloser.phSC, recloser.phSTD, recloser.gPU, recloser.gFC, recloser.gFTD, recloser.gSC, recloser.gSTD, timestamp]
+
+
+def fetch_recloser(recloser):
+    """Connects to a recloser and retrieves its setpoints, returns 0 once they have been retrieved"""
+    if recloser.connect_recloser() == 0:
         
-        if self.model == "651R":
-            try:
-                self.gSC = self.setpoints.split("51G1KC")[1].split(":=")[1].split("51G1KTD")[0].strip()
-                print(self.gSC, end=' ')
+        # Connecting and retrieving required information, the model may already be in the inventory
+        if recloser.load_inventory() != 0:
+            recloser.retrieve_model()
+        if recloser.login() == 0:
+            if recloser.retrieve_group() == 0:
+                # The inventory entry is confirmed once the setpoints are parsed
+                if recloser.retrieve_setpoints() != 0:
+                    recloser.update_inventory(False)
+                recloser.close_connection()
                 return 0
-            except:
-                print("Could not obtain ground slow curve")
-                return 1
-            
-        elif self.model == "351R":
-            try:
-                self.gSC = self.setpoints.split("51G2C =")[1].split("51G2TD=")[0].strip()
-                print(self.gSC, end=' ')
-                return 0
-            except:
-                print("Could not obtain ground slow curve")
-                return 1
-            
-        elif self.model == "351RS":
-            try:
-                self.gSC = self.phSC
-                return 0
-            except:
-                print("Could not obtain ground slow curve")
-                return 1
-            
-    def parse_gSTD(self) -> int:
-        """Parses the setpoints to find ground slow curve time dial"""
-        
-        if self.model == "651R":
-            try:
-                self.gSTD = self.setpoints.split("51G1KTD")[1].split(":=")[1].split("51G1KRS")[0].strip()
-                try:
-                    self.gSTD = self.gSTD.split("51G1KCT")[0].strip()
-                    print(self.gSTD + "\n")
-                    return 0
-                except:
-                    print(self.gSTD + "\n")
-                    return 0
-            except:
-                print("Could not obtain ground slow time dial\n")
-                return 1
-            
-        elif self.model == "351R":
-            try:
-                self.gSTD = self.setpoints.split("51G2TD=")[1].split("51G2CT=")[0].strip()
-                try:
-                    self.gSTD = self.gSTD.split("51G2RS")[0]
-                    print(self.gSTD + "\n")
-                    return 0
-                except:
-                    print(self.gSTD + "\n")
-                    return 0
-            except:
-                print("Could not obtain ground slow time dial\n")
-                return 1
+        recloser.update_inventory(False)
+        recloser.close_connection()
+    return 1
 
-        elif self.model == "351RS":
+
+def parse_recloser(recloser, timestamp):
+    """Parses the setpoints a recloser retrieved, writes them to the output file, a row per group, and returns the rows"""
+    active = recloser.group
+    if recloser.archive is not None:
+        # The listings are read back from setpoints\ one at a time
+        for group, file_name in recloser.group_files.items():
+            recloser.archive.add(recloser.fid, timestamp, {group: read_saved_listing(file_name)}, active)
+    rows = []
+    for group in list(recloser.group_files) or [active]:
+        if recloser.all_groups:
+            print("Group " + str(group))
+        recloser.group = group
+        recloser.settings = recloser.group_settings.get(group, {})
+        recloser.clear_settings()
+        result = recloser.parse_all_settings()
+        if group == active:
+            # A model whose settings are not in the listing was likely wrong in the inventory
+            recloser.update_inventory(result == 0)
+        rows.append(output_row(recloser, timestamp))
+    recloser.group = active
+    
+    # The listings are saved in setpoints\ already, so only the parsed fields are kept
+    recloser.group_files = {}
+    recloser.group_settings = {}
+    recloser.settings = {}
+    
+    # Incrementally updates the output file
+    recloser.results.write_rows(rows)
+    return rows
+
+
+class Gateway:
+    """Limits the sessions open through one gateway and backs off after failures"""
+    def __init__(self, limit):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.failures = 0
+        self.resume = 0.0
+    
+    
+    async def wait(self):
+        """Waits out any backoff before a new session starts"""
+        delay = self.resume - monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+    
+    
+    def record(self, failed, backoff, max_backoff=300):
+        """Doubles the backoff, with jitter, after each consecutive failure and clears it after a success"""
+        if failed:
+            self.failures += 1
+            delay = min(max_backoff, backoff * 2 ** (self.failures - 1))
+            self.resume = monotonic() + delay * random.uniform(0.5, 1.5)
+        else:
+            self.failures = 0
+
+
+async def sweep_async(reclosers, timestamp, concurrency, queue_size=100, parsers=1, gateway_limit=0, retries=1, backoff=5.0, budget=None):
+    """Sweeps the reclosers with up to concurrency sessions open at once
+    
+    Fetching and parsing are pipelined. Fetch workers put reclosers whose setpoints were
+    retrieved on a queue of at most queue_size, and parse workers take them off it to parse
+    and write them. A full queue holds fetch workers back, bounding the listings in memory.
+    
+    Reclosers sharing a gateway are limited to gateway_limit sessions at once (0 for no
+    limit). After a timeout, refusal, reset or lockout the gateway backs off exponentially
+    and the recloser is retried, up to retries times, once the rest of the sweep is done.
+    
+    With a budget, a recloser not expected to finish before its deadline is deferred.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    queue = asyncio.Queue(queue_size)
+    gateways = {}
+    
+    async def fetch_one(recloser_number, recloser, failed):
+        gateway = gateways.setdefault(recloser.gateway, Gateway(gateway_limit or concurrency))
+        async with gateway.semaphore:
+            await gateway.wait()
+            async with semaphore:
+                if budget is not None and not budget.start(recloser):
+                    return
+                print("Recloser " + str(recloser_number) + " of " + str(len(reclosers)))
+                result = await loop.run_in_executor(fetch_executor, fetch_recloser, recloser)
+                retryable = result != 0 and any(reason in RETRYABLE_ERRORS for reason in recloser.errors)
+                gateway.record(retryable, backoff)
+                
+                # The session slot is held until the queue has room, so a full queue holds fetches back
+                if result == 0:
+                    await queue.put(recloser)
+        if retryable:
+            failed.append((recloser_number, recloser))
+    
+    async def parse_worker():
+        while True:
+            recloser = await queue.get()
+            if recloser is None:
+                return
+            # A failed parse must not stop the worker, or fetch workers block on the full queue
             try:
-                self.gSTD = self.phSTD
-                return 0
-            except:
-                print("Could not obtain ground slow time dial\n")
-                return 1            
-            
-    def parse_all_settings(self) -> int:
-        """ This function calls the individual parsers"""
-        self.parse_ctr()
-        self.parse_phPU()
-        self.parse_phFC()
-        self.parse_phFTD()
-        self.parse_phSC()
-        self.parse_phSTD()
-        self.parse_gPU()
-        self.parse_gFC()
-        self.parse_gFTD()
-        self.parse_gSC()
-        self.parse_gSTD()
-
-
-with open("ip_list.csv", "r") as file:
-    
-    # Creating a current time stamp
-    now = datetime.now()
-    timestamp = now.strftime("%Y%m%d") + " " + now.strftime("%H") + ":" + now.strftime("%M")
-    
-    # Clears connection report
-    with open("logs\\connection_errors.txt", "w") as file:
-        file.write("")
-    
-    # Determines the lenght of the IP list
-    ip_list_length = 0
-    with open("ip_list.csv", "r") as file:
-        csv_reader = reader(file)
-        for row in csv_reader:
-            ip_list_length += 1
+                await loop.run_in_executor(parse_executor, parse_recloser, recloser, timestamp)
+            except Exception as error:
+                print("Could not parse " + recloser.fid + ": " + repr(error))
+                recloser.log_error("Parse error")
     
-    # Iterates through the reclosers on the list
-    current_recloser_number = 0
+    # The Recloser session methods block, so each session runs on its own worker thread
+    with ThreadPoolExecutor(max_workers=concurrency) as fetch_executor, ThreadPoolExecutor(max_workers=parsers) as parse_executor:
+        parse_workers = [asyncio.create_task(parse_worker()) for i in range(parsers)]
+        pending = list(enumerate(reclosers, 1))
+        for attempt in range(retries + 1):
+            if attempt > 0:
+                print("Retrying " + str(len(pending)) + " reclosers\n")
+                for recloser_number, recloser in pending:
+                    recloser.errors = []
+            failed = []
+            await asyncio.gather(*(fetch_one(number, recloser, failed) for number, recloser in pending))
+            pending = sorted(failed, key=lambda item: item[0])
+            if not pending:
+                break
+        for worker in parse_workers:
+            await queue.put(None)
+        await asyncio.gather(*parse_workers)
+
+
+def load_intervals(file_name):
+    """Returns the polling interval in seconds of each FID or model named in a schedule file of key,minutes rows"""
+    intervals = {}
+    with open(file_name, "r") as file:
+        for row in reader(file):
+            if len(row) >= 2 and not row[0].startswith("#"):
+                intervals[row[0].strip()] = float(row[1]) * 60
+    return intervals
+
+
+def poll_interval(recloser, intervals, default):
+    """Returns a recloser's polling interval, the one set for its FID, else for its model, else the default"""
+    return intervals.get(recloser.fid, intervals.get(recloser.model, default))
+
+
+async def poll_forever(reclosers, concurrency, interval, intervals=None, changed_interval=600, retry_interval=900,
+                       gateway_limit=0, backoff=5.0, stop_after=None):
+    """Polls each recloser whenever it is due, with up to concurrency sessions open at once
+    
+    Reclosers are kept in a heap by the time they are next due, their first polls spread
+    evenly over their intervals. A recloser whose settings changed is polled again after
+    changed_interval and one that failed after retry_interval, unless its own interval is
+    shorter. Rows are written as each poll is parsed, stamped with the time of the poll.
+    Runs until cancelled, or for stop_after seconds.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    intervals = intervals or {}
+    gateways = {}
+    last_settings = {}
+    polls = set()
+    start = monotonic()
+    schedule = [(start + poll_interval(recloser, intervals, interval) * position / len(reclosers), position, recloser)
+                for position, recloser in enumerate(reclosers)]
+    heapq.heapify(schedule)
+    
+    async def poll_one(position, recloser):
+        gateway = gateways.setdefault(recloser.gateway, Gateway(gateway_limit or concurrency))
+        result = 1
+        changed = False
+        try:
+            async with gateway.semaphore:
+                await gateway.wait()
+                async with semaphore:
+                    # Metrics are of the latest poll only, so the metrics file reads as one sweep's
+                    recloser.errors = []
+                    recloser.metrics = {}
+                    timestamp = format_timestamp(datetime.now())
+                    print("Polling " + recloser.fid)
+                    result = await loop.run_in_executor(executor, fetch_recloser, recloser)
+                gateway.record(result != 0 and any(reason in RETRYABLE_ERRORS for reason in recloser.errors), backoff)
+            if result == 0:
+                rows = await loop.run_in_executor(executor, parse_recloser, recloser, timestamp)
+                settings = [row[3:-1] for row in rows]
+                changed = last_settings.get(recloser.fid, settings) != settings
+                last_settings[recloser.fid] = settings
+        except Exception as error:
+            print("Polling " + recloser.fid + " failed: " + repr(error))
+            recloser.log_error("Poll error")
+            result = 1
+        finally:
+            # A recloser is rescheduled however its poll ended, a failure after retry_interval
+            delay = poll_interval(recloser, intervals, interval)
+            if result != 0:
+                delay = min(delay, retry_interval)
+            elif changed:
+                print("Settings of " + recloser.fid + " changed")
+                delay = min(delay, changed_interval)
+            heapq.heappush(schedule, (monotonic() + delay, position, recloser))
+    
+    # Each recloser is either in the schedule or being polled, never both
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while stop_after is None or monotonic() - start < stop_after:
+            wait = schedule[0][0] - monotonic() if schedule else 1
+            if wait > 0:
+                # Wakes at least every second to pick up reclosers rescheduled sooner
+                await asyncio.sleep(min(wait, 1))
+                continue
+            due, position, recloser = heapq.heappop(schedule)
+            poll = asyncio.create_task(poll_one(position, recloser))
+            polls.add(poll)
+            poll.add_done_callback(polls.discard)
+        await asyncio.gather(*polls)
+
+
+def reparse_dump(job):
+    """Parses one saved SHO listing and returns its output row, or None, and any errors"""
+    file_name, fid, ip = job
+    setpoints = read_saved_listing(file_name)
+    
+    # The timestamp is when the listing was retrieved, not when it is re-parsed
+    return parse_listing(setpoints, fid, ip, format_timestamp(datetime.fromtimestamp(os.path.getmtime(file_name))))
+
+
+def parse_listing(setpoints, fid, ip, timestamp):
+    """Parses a SHO listing without a session and returns its output row, or None, and any errors"""
+    recloser = Recloser(fid=fid, ip=ip)
+    recloser.setpoints = setpoints
+    recloser.model = infer_model(tokenize_setpoints(recloser.setpoints))
+    if recloser.model is None:
+        return None, ["Unknown model"]
+    group = re.search(r"SHO (\d)|Group (\d)", recloser.setpoints)
+    recloser.group = int(group.group(1) or group.group(2)) if group else 99
+    with redirect_stdout(io.StringIO()):
+        recloser.parse_all_settings()
+    return output_row(recloser, timestamp), recloser.errors
+
+
+def reparse_archive(results, ip_addresses, workers=None):
+    """Re-parses every saved SHO listing across a pool of processes and writes the output rows"""
+    prefix, suffix = setpoint_file_name("*").split("*")
+    jobs = []
+    for file_name in sorted(glob.glob(setpoint_file_name("*"))):
+        fid = GROUP_FILE.sub("", file_name[len(prefix):-len(suffix)])
+        jobs.append((file_name, fid, ip_addresses.get(fid, "")))
+    
+    parsed = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for (file_name, fid, ip), (row, errors) in zip(jobs, executor.map(reparse_dump, jobs, chunksize=64)):
+            for reason in errors:
+                results.write_error(fid, ip, reason)
+            if row is not None:
+                results.write_row(row)
+                parsed += 1
+    print("Re-parsed " + str(parsed) + " of " + str(len(jobs)) + " saved setpoint listings")
+
+
+async def probe(recloser, timeout):
+    """Attempts a TCP connection to the recloser, returns None if it answered or the reason it could not be reached"""
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(recloser.ip, recloser.port), timeout)
+    except asyncio.TimeoutError:
+        return "Timed out"
+    except socket.gaierror:
+        return "Socket Error"
+    except ConnectionRefusedError:
+        return "Refused connection"
+    except OSError:
+        return "Unreachable"
+    writer.close()
+    return None
+
+
+async def prescan(reclosers, timeout, concurrency, results):
+    """Probes the reclosers in parallel, logs the unreachable ones and returns those that answered"""
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def probe_one(recloser):
+        async with semaphore:
+            return await probe(recloser, timeout)
+    
+    reasons = await asyncio.gather(*(probe_one(recloser) for recloser in reclosers))
+    live = []
+    for recloser, reason in zip(reclosers, reasons):
+        if reason is None:
+            live.append(recloser)
+        else:
+            print(recloser.ip + " " + reason)
+            results.write_error(recloser.fid, recloser.ip, reason)
+    print(str(len(live)) + " of " + str(len(reclosers)) + " reclosers reachable\n")
+    return live
+
+
+def main():
+    parser = ArgumentParser(description="Retrieves the active group protective element set points from 651R and 351R reclosers")
+    parser.add_argument("--concurrency", type=int, default=1, help="maximum number of reclosers swept at once (default 1, a serial sweep)")
+    parser.add_argument("--queue-size", type=int, default=100, help="maximum retrieved listings waiting to be parsed (default 100)")
+    parser.add_argument("--parsers", type=int, default=1, help="parse workers (default 1)")
+    parser.add_argument("--gateway-concurrency", type=int, default=0, help="maximum sessions at once through one gateway, the third ip_list.csv column or else the /24 subnet (default no limit)")
+    parser.add_argument("--retries", type=int, default=1, help="times a recloser that timed out, refused, was unreachable, lost its connection or locked out is retried at the end of the sweep (default 1)")
+    parser.add_argument("--backoff", type=float, default=5, help="seconds a gateway waits after its first failure, doubling with each further one (default 5)")
+    parser.add_argument("--budget", type=float, help="minutes the sweep may take, reclosers with stale data or failures go first and any not expected to finish in time are deferred")
+    parser.add_argument("--stale-hours", type=float, default=24, help="hours since a recloser's last success before its data counts as stale (default 24)")
+    parser.add_argument("--shard", type=shard_argument, help="sweep only shard I of N, I/N, of ip_list.csv, partitioned by a hash of the FID")
+    parser.add_argument("--sweep-id", type=sweep_id_argument, help="YYYYMMDD-HHMM naming the sweep and giving its timestamp, shared by every shard")
+    parser.add_argument("--merge", type=int, metavar="N", help="combine the N shard files of --sweep-id into one output file and error log")
+    parser.add_argument("--partial", action="store_true", help="merge the shards found even if some are missing")
+    parser.add_argument("--daemon", action="store_true", help="keep polling each recloser when it is due instead of sweeping once, --concurrency sessions at most")
+    parser.add_argument("--interval", type=float, default=60, help="minutes between polls of a recloser in daemon mode (default 60)")
+    parser.add_argument("--schedule", help="CSV of fid,minutes or model,minutes rows overriding --interval")
+    parser.add_argument("--changed-interval", type=float, default=10, help="minutes before a recloser whose settings changed is polled again (default 10)")
+    parser.add_argument("--retry-interval", type=float, default=15, help="minutes before a recloser that failed is polled again (default 15)")
+    parser.add_argument("--stop-after", type=float, help="minutes after which daemon mode stops (default never)")
+    parser.add_argument("--full-listings", action="store_true", help="page through the whole SHO listing rather than stopping once the needed settings are read")
+    parser.add_argument("--all-groups", action="store_true", help="retrieve every settings group, not just the active one, writing a row per group")
+    parser.add_argument("--incremental", action="store_true", help="reuse saved setpoints for reclosers whose configuration ID and group are unchanged")
+    parser.add_argument("--inventory", action="store_true", help="skip ID for reclosers whose model is in the inventory cache")
+    parser.add_argument("--inventory-ttl", type=float, default=7, help="days before a model in the inventory must be confirmed with ID again (default 7)")
+    parser.add_argument("--prescan", action="store_true", help="probe every recloser in parallel first and only sweep those that answer")
+    parser.add_argument("--prescan-timeout", type=float, default=1.5, help="seconds to wait for each probe (default 1.5)")
+    parser.add_argument("--prescan-concurrency", type=int, default=256, help="maximum number of probes in flight (default 256)")
+    parser.add_argument("--db", nargs="?", const=DATABASE, help="also record the settings in a SQLite history database (default " + DATABASE + ")")
+    parser.add_argument("--archive", nargs="?", const=ARCHIVE, help="also keep every raw listing, compressed and stored once per distinct listing, in an archive (default " + ARCHIVE + ")")
+    parser.add_argument("--reparse", action="store_true", help="re-parse the saved setpoint listings instead of connecting to the reclosers")
+    parser.add_argument("--workers", type=int, help="processes used by --reparse (default one per CPU)")
+    parser.add_argument("--resume", action="store_true", help="finish the last sweep, skipping reclosers already in its output file and appending to it")
+    parser.add_argument("--flush-interval", type=float, default=5, help="maximum seconds between writes to the output file (default 5)")
+    args = parser.parse_args()
+    if (args.shard or args.merge) and not args.sweep_id:
+        parser.error("--shard and --merge need the --sweep-id shared by every shard")
+    
+    if args.merge:
+        missing = merge_shards(args.sweep_id, args.merge, args.partial)
+        if missing:
+            print("Missing shards: " + ", ".join(str(index) for index in missing) + ("" if args.partial else ", nothing merged, --partial merges the rest"))
+        return
+    
+    # Creating a current time stamp, unless the sweep ID gives it
+    started = format_timestamp(datetime.now())
+    timestamp = args.sweep_id or started
+    
+    # Every shard writes its own output file, error log, journal and metrics
+    checkpoint, suffix = CHECKPOINT, ""
+    if args.shard:
+        suffix = "_shard" + str(args.shard[0]) + "of" + str(args.shard[1])
+        checkpoint = shard_file_name(checkpoint, "_" + timestamp.replace(" ","-").replace(":","") + suffix)
+    
+    # A resumed sweep keeps the timestamp and output file of the sweep it finishes
+    done = set()
+    if args.resume and not args.reparse:
+        timestamp, done = load_journal(checkpoint)
+        if timestamp is None:
+            print("No sweep to resume, " + checkpoint + " not found")
+            return
+        print("Resuming the sweep of " + timestamp + ", " + str(len(done)) + " reclosers already done")
+    
+    # The output file is named by the sweep's timestamp, so only once a resumed sweep has its own
+    output, error_log = output_file_name(timestamp), ERROR_LOG
+    if args.shard:
+        output = shard_file_name(output, suffix)
+        error_log = shard_file_name(error_log, "_" + timestamp.replace(" ","-").replace(":","") + suffix)
+    
+    # Clears connection report, a re-parse or resumed sweep adds to the last sweep's
+    if not args.reparse and not args.resume:
+        with open(error_log, "w") as file:
+            file.write("")
+        if not args.daemon:
+            start_journal(checkpoint, timestamp)
+    store = SetpointStore(args.db) if args.db else None
+    results = ResultWriter(output, error_log, interval=args.flush_interval, store=store,
+                           journal_file_name=None if args.reparse or args.daemon else checkpoint)
+    
+    if args.reparse:
+        ip_addresses = {}
+        if os.path.exists("ip_list.csv"):
+            with open("ip_list.csv", "r") as file:
+                ip_addresses = {row[0]: row[1] for row in reader(file)}
+        try:
+            reparse_archive(results, ip_addresses, args.workers)
+        finally:
+            results.close()
+            if store is not None:
+                store.close()
+        return
+    
+    # Reads the IP list
     with open("ip_list.csv", "r") as file:
+        reclosers = [Recloser(ip=row[1], fid=row[0], results=results, gateway=row[2] if len(row) > 2 else None) for row in reader(file)]
+    if args.shard:
+        reclosers = [recloser for recloser in reclosers if shard_of(recloser.fid, args.shard[1]) == args.shard[0]]
+        print("Shard " + str(args.shard[0]) + " of " + str(args.shard[1]) + ": " + str(len(reclosers)) + " reclosers")
+    shard_fids = [recloser.fid for recloser in reclosers]
+    reclosers = [recloser for recloser in reclosers if recloser.fid not in done]
+    for recloser in reclosers:
+        recloser.all_groups = args.all_groups
+        recloser.full_listing = args.full_listings
+    
+    archive = DumpArchive(args.archive) if args.archive else None
+    for recloser in reclosers:
+        recloser.archive = archive
+    
+    # Configuration IDs seen on the last sweep, by FID
+    if args.incremental:
+        config_cache = load_json(CONFIG_CACHE)
+        for recloser in reclosers:
+            recloser.config_cache = config_cache
+    
+    # Models identified on earlier sweeps, by FID, dropping those identified longer ago than the TTL
+    if args.inventory:
+        inventory = {fid: entry for fid, entry in load_json(INVENTORY).items() if time() - entry["identified"] <= args.inventory_ttl * 86400}
+        for recloser in reclosers:
+            recloser.inventory = inventory
+    
+    # Orders the reclosers by priority and starts the clock on the budget before anything is swept
+    attempts = load_json(ATTEMPTS)
+    budget = None
+    if args.budget:
+        durations, models = load_durations()
+        reclosers, estimates = prioritise(reclosers, attempts, durations, models, args.stale_hours * 3600, time())
+        budget = Budget(args.budget * 60, estimates, args.concurrency)
+    
+    swept = reclosers
+    try:
+        if args.prescan:
+            swept = asyncio.run(prescan(reclosers, args.prescan_timeout, args.prescan_concurrency, results))
         
-        csv_reader = reader(file)
+        if args.daemon:
+            # Every recloser is polled, those that did not answer the pre-scan last in the first round
+            intervals = load_intervals(args.schedule) if args.schedule else {}
+            polled = swept + [recloser for recloser in reclosers if recloser not in swept]
+            try:
+                asyncio.run(poll_forever(polled, args.concurrency, args.interval * 60, intervals, args.changed_interval * 60,
+                                         args.retry_interval * 60, args.gateway_concurrency, args.backoff,
+                                         args.stop_after * 60 if args.stop_after else None))
+            except KeyboardInterrupt:
+                print("Polling stopped")
+        else:
+            # A serial sweep is one with a single session, so it backs off and retries the same way
+            asyncio.run(sweep_async(swept, timestamp, args.concurrency, args.queue_size, args.parsers,
+                                    args.gateway_concurrency, args.retries, args.backoff, budget))
         
-        # Iterates through reclosers
-        for row in csv_reader:
-            
-            # Prints recloser X of Y
-            current_recloser_number += 1
-            print("Recloser " + str(current_recloser_number) + " of " + str(ip_list_length))
-            
-            recloser = Recloser(ip=row[1], fid=row[0])
-            if recloser.connect_recloser() == 0:
-                
-                # Connecting and retrieving required information
-                recloser.retrieve_model()
-                if recloser.login() == 0:
-                    if recloser.retrieve_group() == 0:
-                        recloser.retrieve_setpoints()
-                        recloser.close_connection()
-                        
-                        # Parsing the information that was gathered
-                        recloser.parse_all_settings()
-                        
-                        # Incrementally updates the output file
-                        recloser_output = [recloser.fid, recloser.model, recloser.ip, recloser.group, recloser.ctr, recloser.phPU, recloser.phFC, recloser.phFTD, recloser.phSC, recloser.phSTD, recloser.gPU, recloser.gFC, recloser.gFTD, recloser.gSC, recloser.gSTD, timestamp]
-                        output_file_name = "output_" + timestamp.replace(" ","-").replace(":","") + ".csv"
-                        with open(output_file_name, "a", newline='') as file:
-                            write = writer(file)
-                            write.writerow(recloser_output)
-
+        # Deferred reclosers have no row, so --resume picks them up in the next window
+        if budget is not None and budget.deferred:
+            print("Deferred " + str(len(budget.deferred)) + " reclosers not expected to finish inside the budget")
+            for recloser in budget.deferred:
+                results.write_error(recloser.fid, recloser.ip, "Deferred")
+    finally:
+        results.close()
+        if store is not None:
+            store.close()
+        if archive is not None:
+            archive.close()
+        write_metrics(reclosers, "logs\\metrics_" + started.replace(" ","-").replace(":","") + suffix + ".json")
+        record_attempts(attempts, reclosers, time())
+        save_state(ATTEMPTS, attempts, shard_fids if args.shard else None)
+    
+    if args.incremental:
+        save_state(CONFIG_CACHE, config_cache, shard_fids if args.shard else None)
+    if args.inventory:
+        save_state(INVENTORY, inventory, shard_fids if args.shard else None)
 
 
+if __name__ == "__main__":
+    main()
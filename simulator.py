@@ -0,0 +1,260 @@
+import asyncio
+import re
+import socket
+import struct
+import threading
+from argparse import ArgumentParser
+from functools import partial
+
+
+# Firmware identifiers reported in the FID line of the ID response
+FIRMWARE = {
+    "651R": "SEL-651R-R123-V0-Z005003-D20200115",
+    "351R": "SEL-351R-R514-V0-Z003002-D20150310",
+    "351RS": "SEL-351RS-R402-V0-Z002001-D20170822",
+}
+
+# Telnet options offered when a session opens, IAC WILL ECHO and IAC WILL SUPPRESS-GO-AHEAD
+NEGOTIATION = bytes([255, 251, 1, 255, 251, 3])
+TELNET_COMMAND = re.compile(rb"\xff[\xfb-\xfe].|\xff[^\xff]")
+
+# CTRL-X, which cancels the rest of a listing
+CANCEL = b"\x18"
+
+# Settings that are not parsed but make the listing as long as a real one
+FILLER_SETTINGS = [
+    ("E50P", "3"), ("E50G", "2"), ("E51P", "2"), ("E51G", "2"), ("E79", "4"), ("ELOP", "N"),
+    ("50P1P", "6.00"), ("50P2P", "OFF"), ("50P3P", "OFF"), ("50G1P", "3.00"), ("50G2P", "OFF"),
+    ("67P1D", "0.00"), ("67G1D", "0.00"), ("79OI1", "120.00"), ("79OI2", "600.00"), ("79OI3", "900.00"),
+    ("79RSD", "1800.00"), ("79RSLD", "600.00"), ("79CLSD", "0.00"), ("CFD", "60.00"), ("OPO", "52"),
+    ("TR", "51PT OR 51GT OR 50P1T"), ("ULTR", "!(51P OR 51G)"), ("79RI", "TRIP"), ("79DTL", "!IN101"),
+    ("CL", "CC"), ("ULCL", "0"), ("SV1", "0"), ("SV2", "0"), ("SV3", "0"), ("SV4", "0"),
+]
+
+
+def setpoint_listing(model, group):
+    """Returns the lines of a SHO listing for a group in the format of the model"""
+    phase = {"PU": "%.2f" % (0.50 + 0.05 * group), "FC": "U3", "FTD": "%.2f" % (1.00 + 0.5 * group), "SC": "U2", "STD": "%.2f" % (3.00 + 0.5 * group)}
+    ground = {"PU": "%.2f" % (0.25 + 0.05 * group), "FC": "U4", "FTD": "%.2f" % (0.50 + 0.5 * group), "SC": "U1", "STD": "%.2f" % (2.00 + 0.5 * group)}
+
+    if model == "651R":
+        settings = [("CTR", "1000"), ("PTR", "100.00"),
+                    ("51PJP", phase["PU"]), ("51PJC", phase["FC"]), ("51PJTD", phase["FTD"]), ("51PJRS", "N"), ("51PJCT", "0.00"),
+                    ("51PKP", phase["PU"]), ("51PKC", phase["SC"]), ("51PKTD", phase["STD"]), ("51PKRS", "N"), ("51PKCT", "0.00"),
+                    ("51G1JP", ground["PU"]), ("51G1JC", ground["FC"]), ("51G1JTD", ground["FTD"]), ("51G1JRS", "N"), ("51G1JCT", "0.00"),
+                    ("51G1KP", ground["PU"]), ("51G1KC", ground["SC"]), ("51G1KTD", ground["STD"]), ("51G1KRS", "N"), ("51G1KCT", "0.00")]
+        settings += FILLER_SETTINGS
+        cells = [name.ljust(8) + ":= " + value.ljust(10) for name, value in settings]
+    else:
+        settings = [("CTR", "500"), ("PTR", "1.00"),
+                    ("51P1P", phase["PU"]), ("51P1C", phase["FC"]), ("51P1TD", phase["FTD"]), ("51P1RS", "N"), ("51P1CT", "0.00"),
+                    ("51P2P", phase["PU"]), ("51P2C", phase["SC"]), ("51P2TD", phase["STD"]), ("51P2RS", "N"), ("51P2CT", "0.00")]
+        if model == "351R":
+            settings += [("51G1P", ground["PU"]), ("51G1C", ground["FC"]), ("51G1TD", ground["FTD"]), ("51G1RS", "N"), ("51G1CT", "0.00"),
+                         ("51G2P", ground["PU"]), ("51G2C", ground["SC"]), ("51G2TD", ground["STD"]), ("51G2RS", "N"), ("51G2CT", "0.00")]
+        settings += FILLER_SETTINGS
+        cells = [name.ljust(6) + "= " + value.ljust(10) for name, value in settings]
+
+    lines = ["", "FEEDER RECLOSER", "Date: 10/18/26    Time: 12:00:00.000", "", "Group " + str(group), ""]
+    for i in range(0, len(cells), 3):
+        lines.append(" ".join(cells[i:i + 3]).rstrip())
+    return lines
+
+
+class SimulatedRelay:
+    """Describes how one simulated relay responds"""
+    def __init__(self, model="651R", group=1, latency=0.0, page_lines=20, behaviour="normal", lockouts=0, password=None, cid="A1B2", negotiate=True):
+        self.model = model
+        self.group = group
+        self.latency = latency
+        self.page_lines = page_lines
+        self.behaviour = behaviour
+        self.lockouts = lockouts
+        self.password = password
+        self.cid = cid
+        self.negotiate = negotiate
+        self.sessions = 0
+
+
+class RelaySimulator:
+    """Serves simulated SEL relays speaking the ID/ACC/GRO/SHO dialogue on local TCP ports
+
+    Each relay gets its own port. A relay with behaviour "refuse" has nothing listening on its
+    port and one with behaviour "timeout" never completes the TCP handshake. A relay with
+    lockouts resets its first sessions at the ID command, as a relay that has been logged in
+    to too many times in a row does.
+    """
+    def __init__(self, relays, host="127.0.0.1"):
+        self.relays = relays
+        self.host = host
+        self.addresses = []
+        self.servers = []
+        self.sockets = []
+
+    def start(self):
+        """Starts serving on a background thread and returns the (host, port) of each relay"""
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.addresses = asyncio.run_coroutine_threadsafe(self.open_ports(), self.loop).result()
+        return self.addresses
+
+
+    def stop(self):
+        """Stops serving and closes every port"""
+        asyncio.run_coroutine_threadsafe(self.close_ports(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        for sock in self.sockets:
+            sock.close()
+
+
+    async def open_ports(self):
+        """Opens a port for each relay according to its behaviour"""
+        addresses = []
+        for relay in self.relays:
+            if relay.behaviour == "refuse":
+                # Reserves a free port and releases it so connections to it are refused
+                sock = socket.socket()
+                sock.bind((self.host, 0))
+                port = sock.getsockname()[1]
+                sock.close()
+            elif relay.behaviour == "timeout":
+                # Fills the accept backlog of a socket that never accepts so later handshakes stall
+                sock = socket.socket()
+                sock.bind((self.host, 0))
+                sock.listen(0)
+                port = sock.getsockname()[1]
+                self.sockets.append(sock)
+                for i in range(3):
+                    filler = socket.socket()
+                    filler.setblocking(False)
+                    try:
+                        filler.connect((self.host, port))
+                    except BlockingIOError:
+                        pass
+                    self.sockets.append(filler)
+            else:
+                server = await asyncio.start_server(partial(self.serve, relay), self.host, 0)
+                port = server.sockets[0].getsockname()[1]
+                self.servers.append(server)
+            addresses.append((self.host, port))
+        return addresses
+
+
+    async def close_ports(self):
+        """Closes the servers and ends any sessions still open"""
+        for server in self.servers:
+            server.close()
+        sessions = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in sessions:
+            task.cancel()
+        await asyncio.gather(*sessions, return_exceptions=True)
+
+
+    async def respond(self, relay, writer, text):
+        """Sends a response after the relay's latency"""
+        if relay.latency:
+            await asyncio.sleep(relay.latency)
+        writer.write(text.encode('ascii'))
+        await writer.drain()
+
+
+    async def read_continuation(self, reader):
+        """Reads the key pressed at the end of a page, returns False if it was CTRL-X"""
+        while True:
+            char = await reader.read(1)
+            if not char or char == CANCEL:
+                return False
+            if char == b"\n":
+                return True
+
+
+    async def serve(self, relay, reader, writer):
+        """Runs one Telnet session with a simulated relay"""
+        relay.sessions += 1
+        level = 0
+        prompts = {0: "=", 1: "=>", 2: "==>"}
+        try:
+            if relay.negotiate:
+                writer.write(NEGOTIATION)
+            await self.respond(relay, writer, "\r\n" + prompts[level])
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                # A CTRL-X that cancelled a listing already complete is ignored
+                command = TELNET_COMMAND.sub(b"", line).replace(CANCEL, b"").decode('ascii', 'ignore').strip()
+                words = command.upper().split()
+
+                if words[:1] == ["ID"]:
+                    if relay.sessions <= relay.lockouts:
+                        # Resets the connection, which the client sees as ConnectionResetError
+                        sock = writer.get_extra_info("socket")
+                        sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+                        writer.transport.abort()
+                        return
+                    response = ["", '"FID=' + FIRMWARE[relay.model] + '","0A1B"', '"BFID=BOOTLDR-R500-V0-Z000000-D20120101","0921"',
+                                '"CID=' + relay.cid + '","0214"', '"DEVID=FEEDER RECLOSER","04C6"', '"DEVCODE=71","0312"',
+                                '"PARTNO=' + relay.model + '1X2X3X4X","0658"', '"CONFIG=11110000","0402"']
+                    await self.respond(relay, writer, command + "\r\n".join(response) + "\r\n" + prompts[level])
+
+                elif words[:1] == ["ACC"]:
+                    await self.respond(relay, writer, command + "\r\nPassword: ? ")
+                    password = (await reader.readline()).decode('ascii', 'ignore').strip()
+                    if relay.password is None or password == relay.password:
+                        level = 1
+                        await self.respond(relay, writer, "\r\n\r\nFEEDER RECLOSER\r\nLevel 1\r\n" + prompts[level])
+                    else:
+                        await self.respond(relay, writer, "\r\nInvalid Password\r\n" + prompts[level])
+
+                elif words[:1] == ["GRO"] and level > 0:
+                    await self.respond(relay, writer, command + "\r\nActive Group = " + str(relay.group) + "\r\n\r\n" + prompts[level])
+
+                elif words[:1] == ["SHO"] and level > 0:
+                    group = int(words[1]) if len(words) > 1 and words[1].isdigit() else relay.group
+                    lines = setpoint_listing(relay.model, group)
+                    if relay.model in ("351R", "351RS"):
+                        pages = [lines[i:i + relay.page_lines] for i in range(0, len(lines), relay.page_lines)]
+                    else:
+                        pages = [lines]
+                    await self.respond(relay, writer, command + "\r\n")
+                    for page in pages[:-1]:
+                        # Paged models wait for a CRLF before sending the next page, or a CTRL-X to stop
+                        await self.respond(relay, writer, "\r\n".join(page) + "\r\n")
+                        if not await self.read_continuation(reader):
+                            await self.respond(relay, writer, "\r\n" + prompts[level])
+                            break
+                    else:
+                        await self.respond(relay, writer, "\r\n".join(pages[-1]) + "\r\n\r\n" + prompts[level])
+
+                elif command:
+                    await self.respond(relay, writer, command + "\r\nInvalid Command\r\n\r\n" + prompts[level])
+                else:
+                    await self.respond(relay, writer, "\r\n" + prompts[level])
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def main():
+    parser = ArgumentParser(description="Serves simulated SEL 651R/351R/351RS relays on local ports")
+    parser.add_argument("--devices", type=int, default=10, help="number of simulated relays")
+    parser.add_argument("--models", default="651R,351R,351RS", help="comma separated models assigned to relays in turn")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before each response")
+    args = parser.parse_args()
+
+    models = args.models.split(",")
+    relays = [SimulatedRelay(model=models[i % len(models)], latency=args.latency) for i in range(args.devices)]
+    simulator = RelaySimulator(relays)
+    for relay, (host, port) in zip(relays, simulator.start()):
+        print(relay.model + " " + host + ":" + str(port))
+    try:
+        simulator.thread.join()
+    except KeyboardInterrupt:
+        simulator.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import sqlite3
+import sys
+from argparse import ArgumentParser
+from csv import reader, writer
+from functools import lru_cache
+from itertools import groupby
+
+
+DATABASE = "setpoints\\history.db"
+
+# Columns in the order of the output file, the group column is named setting_group as GROUP is an SQL keyword
+COLUMNS = ("fid", "model", "ip", "setting_group", "ctr", "phPU", "phFC", "phFTD", "phSC", "phSTD",
+           "gPU", "gFC", "gFTD", "gSC", "gSTD", "timestamp")
+SETTING_COLUMNS = COLUMNS[3:-1]
+
+
+@lru_cache(maxsize=65536)
+def compact(value):
+    """Returns a setting as a float if it is numeric, otherwise as an interned string
+
+    A fleet uses few distinct values, so records share the objects of repeated ones.
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return sys.intern(str(value))
+
+
+class SetpointRecord:
+    """Parsed settings of one device and group, holding only the parsed fields
+
+    Records have no per-instance dictionary, numeric settings are floats and curve codes,
+    models and timestamps are interned, so tens of thousands of devices over many sweeps
+    fit in memory for analysis.
+    """
+    __slots__ = COLUMNS
+
+    def __init__(self, *values):
+        for column, value in zip(COLUMNS, values):
+            setattr(self, column, value)
+
+
+    @classmethod
+    def from_row(cls, row):
+        """Returns the record of a row in the order of the output file"""
+        fid, model, ip, group, ctr = row[:5]
+        try:
+            group = int(group)
+            ctr = int(ctr)
+        except (TypeError, ValueError):
+            pass
+        return cls(fid, sys.intern(str(model)), ip, group, ctr, *[compact(value) for value in row[5:-1]], sys.intern(row[-1]))
+
+
+    def row(self):
+        """Returns the record's values in the order of the output file"""
+        return [getattr(self, column) for column in COLUMNS]
+
+
+def read_records(file_name):
+    """Yields a record for every row of an output file, one row at a time"""
+    with open(file_name, "r", newline='') as file:
+        for row in reader(file):
+            if len(row) == len(COLUMNS):
+                yield SetpointRecord.from_row(row)
+
+
+class SetpointStore:
+    """SQLite history of the settings parsed on every sweep"""
+    def __init__(self, file_name=DATABASE):
+        # Writes come from whichever sweep thread flushes the ResultWriter, which serialises them
+        self.connection = sqlite3.connect(file_name, check_same_thread=False)
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS setpoints (
+            fid TEXT NOT NULL, model TEXT, ip TEXT, setting_group INTEGER, ctr INTEGER,
+            phPU TEXT, phFC TEXT, phFTD TEXT, phSC TEXT, phSTD TEXT,
+            gPU TEXT, gFC TEXT, gFTD TEXT, gSC TEXT, gSTD TEXT,
+            timestamp TEXT NOT NULL)""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS setpoints_fid ON setpoints (fid, timestamp)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS setpoints_timestamp ON setpoints (timestamp)")
+        self.connection.commit()
+
+
+    def add_rows(self, rows):
+        """Stores rows in the order of the output file"""
+        self.connection.executemany("INSERT INTO setpoints VALUES (" + ", ".join("?" * len(COLUMNS)) + ")", rows)
+        self.connection.commit()
+
+
+    def latest(self):
+        """Returns the most recent row for every device"""
+        return self.connection.execute("""SELECT setpoints.* FROM setpoints
+            JOIN (SELECT fid, MAX(timestamp) AS timestamp FROM setpoints GROUP BY fid) AS newest
+            USING (fid, timestamp) ORDER BY fid""").fetchall()
+
+
+    def sweep(self, timestamp):
+        """Returns the rows written by one sweep"""
+        return self.connection.execute("SELECT * FROM setpoints WHERE timestamp = ? ORDER BY fid", (timestamp,)).fetchall()
+
+
+    def records(self, timestamp=None):
+        """Yields a record for every stored row, or for the rows of one sweep, without loading them all at once"""
+        if timestamp:
+            cursor = self.connection.execute("SELECT * FROM setpoints WHERE timestamp = ? ORDER BY fid", (timestamp,))
+        else:
+            cursor = self.connection.execute("SELECT * FROM setpoints ORDER BY fid, timestamp")
+        for row in cursor:
+            yield SetpointRecord.from_row(row)
+
+
+    def history(self, fid):
+        """Returns every row for a device, oldest first and by group within a sweep"""
+        return self.connection.execute("SELECT * FROM setpoints WHERE fid = ? ORDER BY timestamp, setting_group", (fid,)).fetchall()
+
+
+    def changes(self, fid):
+        """Returns (timestamp, column, old value, new value) for every setting of a device that changed between sweeps
+
+        A sweep's first row is its active group, so a change of active group is reported as
+        a setting_group change. Each group is compared with the same group in the sweep before,
+        or the active groups when the two sweeps retrieved no group in common.
+        """
+        group = COLUMNS.index("setting_group")
+        columns = [(column, COLUMNS.index(column)) for column in SETTING_COLUMNS if column != "setting_group"]
+        rows = self.connection.execute("SELECT * FROM setpoints WHERE fid = ? ORDER BY timestamp, rowid", (fid,))
+        changes = []
+        previous = None
+        for timestamp, sweep in groupby(rows, key=lambda row: row[-1]):
+            groups = {}
+            for row in sweep:
+                groups.setdefault(row[group], row)
+            if previous is not None:
+                old_active = next(iter(previous))
+                new_active = next(iter(groups))
+                if str(old_active) != str(new_active):
+                    changes.append((timestamp, "setting_group", old_active, new_active))
+                pairs = [(number, number) for number in groups if number in previous] or [(old_active, new_active)]
+                for old_group, new_group in pairs:
+                    old, new = previous[old_group], groups[new_group]
+                    label = "G" + str(new_group) + " " if len(groups) > 1 or len(previous) > 1 else ""
+                    changes.extend((timestamp, label + column, old[index], new[index]) for column, index in columns
+                                   if str(old[index]) != str(new[index]))
+            previous = groups
+        return changes
+
+
+    def export_csv(self, file_name, timestamp=None):
+        """Writes one sweep, or the latest row for every device, in the format of the output file"""
+        rows = self.sweep(timestamp) if timestamp else self.latest()
+        with open(file_name, "w", newline='') as file:
+            writer(file).writerows(rows)
+        return len(rows)
+
+
+    def close(self):
+        """Closes the database"""
+        self.connection.close()
+
+
+def main():
+    parser = ArgumentParser(description="Queries the setpoint history database")
+    parser.add_argument("--db", default=DATABASE, help="database file (default " + DATABASE + ")")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("latest", help="print the latest settings of every device")
+    history = commands.add_parser("history", help="print every sweep's settings for a device")
+    history.add_argument("fid")
+    changes = commands.add_parser("changes", help="print the settings of a device that changed between sweeps")
+    changes.add_argument("fid")
+    export = commands.add_parser("export", help="write a sweep, or the latest settings, as an output CSV")
+    export.add_argument("file_name")
+    export.add_argument("--timestamp", help="sweep timestamp, for example \"20240101 06:00\"")
+    args = parser.parse_args()
+
+    store = SetpointStore(args.db)
+    if args.command == "latest":
+        for row in store.latest():
+            print(",".join(str(value) for value in row))
+    elif args.command == "history":
+        for row in store.history(args.fid):
+            print(",".join(str(value) for value in row))
+    elif args.command == "changes":
+        for timestamp, column, old, new in store.changes(args.fid):
+            print(timestamp + " " + column + ": " + str(old) + " -> " + str(new))
+    elif args.command == "export":
+        print(str(store.export_csv(args.file_name, args.timestamp)) + " rows written to " + args.file_name)
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import sys
+from argparse import ArgumentParser
+from csv import reader, writer
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from store import read_records
+
+
+# Inverse-time curves as (A, B, p), the trip time at M multiples of pickup being TD * (A + B / (M ** p - 1))
+CURVES = {
+    # US curves
+    "U1": (0.0226, 0.0104, 0.02),
+    "U2": (0.180, 5.95, 2.0),
+    "U3": (0.0963, 3.88, 2.0),
+    "U4": (0.02434, 5.64, 2.0),
+    "U5": (0.00262, 0.00342, 0.02),
+    # IEC curves
+    "C1": (0.0, 0.14, 0.02),
+    "C2": (0.0, 13.5, 1.0),
+    "C3": (0.0, 80.0, 2.0),
+    "C4": (0.0, 120.0, 1.0),
+    "C5": (0.0, 0.05, 0.04),
+}
+
+# Curves of every recloser as (name, pickup, curve, time dial) fields
+ELEMENTS = (("phase fast", "phPU", "phFC", "phFTD"), ("phase slow", "phPU", "phSC", "phSTD"),
+            ("ground fast", "gPU", "gFC", "gFTD"), ("ground slow", "gPU", "gSC", "gSTD"))
+
+
+def load_devices(file_name):
+    """Returns the record of every device in an output file, the active group's if a device has several rows"""
+    devices = {}
+    for record in read_records(file_name):
+        devices.setdefault(record.fid, record)
+    return devices
+
+
+def load_topology(file_name):
+    """Returns the (upstream FID, downstream FID) pairs of a feeder topology file"""
+    with open(file_name, "r", newline='') as file:
+        return [(row[0].strip(), row[1].strip()) for row in reader(file) if len(row) >= 2 and not row[0].startswith("#")]
+
+
+def curve_parameters(records):
+    """Returns the primary pickup, A, B, p and time dial of every element as (devices, elements) arrays
+
+    Elements with an unknown curve or a setting that is not a number get NaN and never trip.
+    """
+    parameters = np.full((5, len(records), len(ELEMENTS)), np.nan)
+    for i, record in enumerate(records):
+        for j, (name, pickup, curve, dial) in enumerate(ELEMENTS):
+            values = (getattr(record, pickup), getattr(record, dial), record.ctr)
+            if getattr(record, curve) in CURVES and all(isinstance(value, (int, float)) for value in values):
+                parameters[:, i, j] = (values[0] * values[2],) + CURVES[getattr(record, curve)] + (values[1],)
+    return parameters
+
+
+def trip_times(parameters, currents):
+    """Returns the trip time of every element at every fault current as a (devices, elements, currents) array
+
+    Elements do not trip, an infinite time, at or below pickup.
+    """
+    pickup, a, b, p, dial = (parameter[..., np.newaxis] for parameter in parameters)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        multiple = currents / pickup
+        times = dial * (a + b / (multiple ** p - 1))
+    return np.where((multiple > 1) & np.isfinite(times), times, np.inf)
+
+
+def check_coordination(devices, pairs, currents, margin, chunk_size=4096):
+    """Returns (upstream, downstream, element, minimum margin, current) for every pair closer than the margin
+
+    The margin of an element is the upstream time less the downstream time, taken over the
+    currents at which the downstream element trips. Pairs naming a device that is not in the
+    sweep are returned with an element of "missing".
+    """
+    fids = list(devices)
+    index = {fid: i for i, fid in enumerate(fids)}
+    violations = [(upstream, downstream, "missing", "", "") for upstream, downstream in pairs
+                  if upstream not in index or downstream not in index]
+    pairs = [(upstream, downstream) for upstream, downstream in pairs if upstream in index and downstream in index]
+    if not pairs:
+        return violations
+
+    parameters = curve_parameters([devices[fid] for fid in fids])
+    upstream = np.array([index[pair[0]] for pair in pairs])
+    downstream = np.array([index[pair[1]] for pair in pairs])
+
+    # Every pair, element and current of a chunk in one (pairs, elements, currents) computation,
+    # chunks bounding the memory used by a large feeder
+    for start in range(0, len(pairs), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        downstream_times = trip_times(parameters[:, downstream[chunk]], currents)
+        with np.errstate(invalid="ignore"):
+            margins = np.where(np.isfinite(downstream_times), trip_times(parameters[:, upstream[chunk]], currents) - downstream_times, np.inf)
+        worst = margins.argmin(axis=2)
+        minimum = np.take_along_axis(margins, worst[..., np.newaxis], axis=2)[..., 0]
+        for k, j in zip(*np.nonzero(minimum < margin)):
+            violations.append((pairs[start + k][0], pairs[start + k][1], ELEMENTS[j][0], float(minimum[k, j]), float(currents[worst[k, j]])))
+    return violations
+
+
+def main():
+    parser = ArgumentParser(description="Checks the time-current coordination of upstream and downstream reclosers in a sweep")
+    parser.add_argument("output_file", help="sweep output file with the settings of every recloser")
+    parser.add_argument("topology", help="CSV of upstream_fid,downstream_fid pairs")
+    parser.add_argument("--margin", type=float, default=0.2, help="minimum seconds between downstream and upstream trip times (default 0.2)")
+    parser.add_argument("--min-current", type=float, default=50, help="lowest primary fault current checked in amps (default 50)")
+    parser.add_argument("--max-current", type=float, default=20000, help="highest primary fault current checked in amps (default 20000)")
+    parser.add_argument("--points", type=int, default=200, help="fault currents checked, spaced logarithmically (default 200)")
+    parser.add_argument("--csv", help="also write the pairs below the margin to this file")
+    args = parser.parse_args()
+
+    if np is None:
+        print("tcc.py needs NumPy, install it with pip install numpy")
+        return 1
+
+    devices = load_devices(args.output_file)
+    pairs = load_topology(args.topology)
+    currents = np.geomspace(args.min_current, args.max_current, args.points)
+    violations = check_coordination(devices, pairs, currents, args.margin)
+
+    for upstream, downstream, element, minimum, current in violations:
+        if element == "missing":
+            print(upstream + " -> " + downstream + ": not in " + args.output_file)
+        else:
+            print(upstream + " -> " + downstream + " " + element + ": %.3f s at %.0f A" % (minimum, current))
+    print(str(len({violation[:2] for violation in violations})) + " of " + str(len(pairs)) + " pairs below a margin of " + str(args.margin) + " s")
+
+    if args.csv:
+        with open(args.csv, "w", newline='') as file:
+            output = writer(file)
+            output.writerow(["upstream", "downstream", "element", "margin", "current"])
+            output.writerows(violations)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
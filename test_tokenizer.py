@@ -0,0 +1,68 @@
+import io
+import unittest
+from contextlib import redirect_stdout
+
+from main import Recloser, infer_model, tokenize_setpoints
+from simulator import setpoint_listing
+
+
+# Fields parsed out of a simulated listing of group 1, by model
+EXPECTED = {
+    "651R": {"ctr": 1000, "phPU": "0.55", "phFC": "U3", "phFTD": "1.50", "phSC": "U2", "phSTD": "3.50",
+             "gPU": "0.30", "gFC": "U4", "gFTD": "1.00", "gSC": "U1", "gSTD": "2.50"},
+    "351R": {"ctr": 500, "phPU": "0.55", "phFC": "U3", "phFTD": "1.50", "phSC": "U2", "phSTD": "3.50",
+             "gPU": "0.30", "gFC": "U4", "gFTD": "1.00", "gSC": "U1", "gSTD": "2.50"},
+    "351RS": {"ctr": 500, "phPU": "0.55", "phFC": "U3", "phFTD": "1.50", "phSC": "U2", "phSTD": "3.50",
+              "gPU": "0.55", "gFC": "U3", "gFTD": "1.50", "gSC": "U2", "gSTD": "3.50"},
+}
+
+
+def parse(model, listing):
+    """Returns the recloser a listing parses into, and parse_all_settings' result"""
+    recloser = Recloser(fid="F1", ip="127.0.0.1")
+    recloser.model = model
+    recloser.setpoints = listing
+    with redirect_stdout(io.StringIO()):
+        result = recloser.parse_all_settings()
+    return recloser, result
+
+
+class TokenizerTest(unittest.TestCase):
+    def test_simulated_listings(self):
+        for model, expected in EXPECTED.items():
+            with self.subTest(model=model):
+                listing = "\r\n".join(setpoint_listing(model, 1)) + "\r\n=>"
+                self.assertEqual(infer_model(tokenize_setpoints(listing)), model)
+                recloser, result = parse(model, listing)
+                self.assertEqual(result, 0)
+                self.assertEqual({field: getattr(recloser, field) for field in expected}, expected)
+
+    def test_values_with_spaces(self):
+        settings = tokenize_setpoints("TR      := 51PT OR 51GT OR 50P1T ULTR    := !(51P OR 51G)\r\n"
+                                      "DEVID = FEEDER RECLOSER  CTR = 500\r\n")
+        self.assertEqual(settings["TR"], "51PT OR 51GT OR 50P1T")
+        self.assertEqual(settings["ULTR"], "!(51P OR 51G)")
+        self.assertEqual(settings["DEVID"], "FEEDER RECLOSER")
+        self.assertEqual(settings["CTR"], "500")
+
+    def test_names_without_spaces(self):
+        recloser, result = parse("651R", "CTR:=1000 51PJP:=0.55 51PJC:=U3 51PJTD:=1.50\r\n"
+                                         "51PKC:=U2 51PKTD:=3.50 51G1JP:=0.30 51G1JC:=U4\r\n"
+                                         "51G1JTD:=1.00 51G1KC:=U1 51G1KTD:=2.50\r\n=>")
+        self.assertEqual(result, 0)
+        self.assertEqual({field: getattr(recloser, field) for field in EXPECTED["651R"]}, EXPECTED["651R"])
+        recloser, result = parse("351R", "CTR=500 51P1P=0.55 51P1C=U3 51P1TD=1.50 51P2C=U2 51P2TD=3.50\r\n"
+                                         "51G1P=0.30 51G1C=U4 51G1TD=1.00 51G2C=U1 51G2TD=2.50\r\n=>")
+        self.assertEqual(result, 0)
+        self.assertEqual({field: getattr(recloser, field) for field in EXPECTED["351R"]}, EXPECTED["351R"])
+
+    def test_prompt_is_not_a_setting(self):
+        settings = tokenize_setpoints("CTR := 1000\r\n=>")
+        self.assertEqual(settings, {"CTR": "1000"})
+
+    def test_first_occurrence_kept(self):
+        self.assertEqual(tokenize_setpoints("CTR = 500\r\nCTR = 600\r\n")["CTR"], "500")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,261 @@
+import asyncio
+import re
+import select
+import socket
+from time import monotonic
+
+
+# Telnet command bytes
+IAC = 255
+DONT = 254
+DO = 253
+WONT = 252
+WILL = 251
+SB = 250
+SE = 240
+
+# NUL padding and DC1 (XON) flow control, dropped from the data as telnetlib did
+FILLER = b"\x00\x11"
+
+
+class TelnetStream:
+    """Buffers received Telnet data with the option negotiation removed
+
+    Every option the far end offers or requests is refused, which is all SEL relays need.
+    Received data is appended to a single bytearray, so nothing is decoded or concatenated
+    until a response is complete. NUL and DC1 bytes are dropped from the data as they arrive.
+    """
+    def __init__(self):
+        self.buffer = bytearray()
+        self.eof = False
+        self.state = "data"
+        self.command = 0
+        self.bytes_received = 0
+
+
+    def feed(self, data):
+        """Appends received data to the buffer and returns any negotiation replies to send"""
+        self.bytes_received += len(data)
+        replies = bytearray()
+        i = 0
+        while i < len(data):
+            if self.state == "data":
+                # Copies everything up to the next command in one slice
+                end = data.find(IAC, i)
+                if end == -1:
+                    self.buffer += data[i:].translate(None, FILLER)
+                    break
+                self.buffer += data[i:end].translate(None, FILLER)
+                self.state = "iac"
+                i = end + 1
+                continue
+            byte = data[i]
+            if self.state == "iac":
+                if byte == IAC:
+                    self.buffer.append(IAC)
+                    self.state = "data"
+                elif byte in (DO, DONT, WILL, WONT):
+                    self.command = byte
+                    self.state = "option"
+                elif byte == SB:
+                    self.state = "subnegotiation"
+                else:
+                    self.state = "data"
+            elif self.state == "option":
+                if self.command == DO:
+                    replies += bytes([IAC, WONT, byte])
+                elif self.command == WILL:
+                    replies += bytes([IAC, DONT, byte])
+                self.state = "data"
+            elif self.state == "subnegotiation":
+                if byte == IAC:
+                    self.state = "subnegotiation iac"
+            elif self.state == "subnegotiation iac":
+                self.state = "data" if byte == SE else "subnegotiation"
+            i += 1
+        return bytes(replies)
+
+
+    def search(self, patterns):
+        """Returns the index and match of the first pattern found in the buffer, or (-1, None)"""
+        for index, pattern in enumerate(patterns):
+            match = pattern.search(self.buffer)
+            if match:
+                return index, match
+        return -1, None
+
+
+    def take_match(self, pattern, match):
+        """Removes and returns the buffer up to the end of a match, with the match made again on the returned bytes
+
+        A match on the buffer itself would no longer hold its text once the buffer is taken.
+        """
+        output = self.take(match.end())
+        return pattern.match(output, match.start()), output
+
+
+    def take(self, end=None):
+        """Removes and returns the buffer up to end, or all of it"""
+        end = len(self.buffer) if end is None else end
+        output = bytes(self.buffer[:end])
+        del self.buffer[:end]
+        return output
+
+
+def compile_patterns(patterns):
+    """Compiles any patterns given as bytes"""
+    return [re.compile(pattern) if isinstance(pattern, bytes) else pattern for pattern in patterns]
+
+
+class Telnet(TelnetStream):
+    """Blocking Telnet client with the subset of the telnetlib interface the Recloser class uses"""
+    def __init__(self, host, port=23, timeout=10):
+        super().__init__()
+        self.sock = socket.create_connection((host, port), timeout)
+
+
+    def fill(self, timeout):
+        """Waits up to timeout for data and buffers it, returns False if none arrived"""
+        if not select.select([self.sock.fileno()], [], [], max(timeout, 0))[0]:
+            return False
+        data = self.sock.recv(4096)
+        if not data:
+            self.eof = True
+            return True
+        replies = self.feed(data)
+        if replies:
+            self.sock.sendall(replies)
+        return True
+
+
+    def write(self, data):
+        """Sends data, doubling any IAC bytes"""
+        self.sock.sendall(data.replace(bytes([IAC]), bytes([IAC, IAC])))
+
+
+    def read_some(self, timeout):
+        """Waits up to timeout for data unless some is buffered, returns everything received so far"""
+        if not self.buffer and not self.eof:
+            self.fill(timeout)
+        if self.eof and not self.buffer:
+            raise EOFError("telnet connection closed")
+        return self.take()
+
+
+    def read_very_eager(self):
+        """Returns everything received so far without blocking"""
+        while not self.eof and self.fill(0):
+            pass
+        if self.eof and not self.buffer:
+            raise EOFError("telnet connection closed")
+        return self.take()
+
+
+    def expect(self, patterns, timeout=None):
+        """Reads until one of the patterns matches or the timeout expires, returns (index, match, output)
+
+        On a timeout the index is -1 and the output is everything received so far.
+        """
+        patterns = compile_patterns(patterns)
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            index, match = self.search(patterns)
+            if match:
+                return (index,) + self.take_match(patterns[index], match)
+            if self.eof:
+                if not self.buffer:
+                    raise EOFError("telnet connection closed")
+                return -1, None, self.take()
+            wait = 60 if deadline is None else deadline - monotonic()
+            if wait <= 0:
+                return -1, None, self.take()
+            self.fill(wait)
+
+
+    def read_until(self, expected, timeout=None):
+        """Reads until the expected bytes are received or the timeout expires"""
+        return self.expect([re.escape(expected)], timeout)[2]
+
+
+    def close(self):
+        """Closes the connection"""
+        if self.sock:
+            self.sock.close()
+        self.sock = None
+
+
+class AsyncTelnet(TelnetStream):
+    """asyncio Telnet client with the same read-until-pattern interface as Telnet"""
+    def __init__(self, reader, writer):
+        super().__init__()
+        self.reader = reader
+        self.writer = writer
+
+
+    @classmethod
+    async def open(cls, host, port=23, timeout=10):
+        """Connects to host and returns an AsyncTelnet, raising TimeoutError if it takes longer than timeout"""
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        return cls(reader, writer)
+
+
+    async def fill(self, timeout):
+        """Waits up to timeout for data and buffers it, returns False if none arrived"""
+        try:
+            data = await asyncio.wait_for(self.reader.read(4096), max(timeout, 0))
+        except asyncio.TimeoutError:
+            return False
+        if not data:
+            self.eof = True
+            return True
+        replies = self.feed(data)
+        if replies:
+            self.writer.write(replies)
+        return True
+
+
+    async def write(self, data):
+        """Sends data, doubling any IAC bytes"""
+        self.writer.write(data.replace(bytes([IAC]), bytes([IAC, IAC])))
+        await self.writer.drain()
+
+
+    async def expect(self, patterns, timeout=None):
+        """Reads until one of the patterns matches or the timeout expires, returns (index, match, output)"""
+        patterns = compile_patterns(patterns)
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            index, match = self.search(patterns)
+            if match:
+                return (index,) + self.take_match(patterns[index], match)
+            if self.eof:
+                if not self.buffer:
+                    raise EOFError("telnet connection closed")
+                return -1, None, self.take()
+            wait = 60 if deadline is None else deadline - monotonic()
+            if wait <= 0:
+                return -1, None, self.take()
+            await self.fill(wait)
+
+
+    async def read_some(self, timeout):
+        """Waits up to timeout for data unless some is buffered, returns everything received so far"""
+        if not self.buffer and not self.eof:
+            await self.fill(timeout)
+        if self.eof and not self.buffer:
+            raise EOFError("telnet connection closed")
+        return self.take()
+
+
+    async def read_until(self, expected, timeout=None):
+        """Reads until the expected bytes are received or the timeout expires"""
+        return (await self.expect([re.escape(expected)], timeout))[2]
+
+
+    async def close(self):
+        """Closes the connection"""
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass